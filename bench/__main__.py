@@ -0,0 +1,129 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# the etl modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl"))
+
+import harnesslib
+import synthlib
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+OFSTED_RATIO = 0.01
+
+
+def run():
+    args = get_args()
+    rows = parse_scale(args.scale)
+    data_folder = args.data_folder or os.path.join(tempfile.gettempdir(), "etl-bench", str(rows))
+    ensure_data(data_folder, rows)
+    results, peaks = {}, {}
+    for stage in args.stages:
+        # a fresh interpreter per stage, so peak RSS is not inherited from the previous one
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            future = pool.submit(
+                harnesslib.run_stage,
+                stage,
+                data_folder=data_folder,
+                chunk_size=args.chunk_size,
+                workers=args.workers,
+                pipeline=args.pipeline,
+            )
+            outcome = future.result()
+            peaks[stage] = outcome["peak_rss_mb"]
+            for result in outcome["results"]:
+                results[result["stage"]] = result
+    baselines = load_baselines(args.baseline)
+    baseline = baselines.get(str(rows), {})
+    regressions = report(results, baseline.get("results", {}), args.tolerance)
+    regressions += report_peaks(peaks, baseline.get("peak_rss_mb", {}), args.tolerance)
+    if regressions:
+        print(f"regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+    if args.save_baseline:
+        baselines[str(rows)] = {"results": results, "peak_rss_mb": peaks}
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(baselines, fh, indent=2)
+    sys.exit(1 if regressions and not args.save_baseline else 0)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(prog="bench", description="ETL throughput benchmarks on synthetic data")
+    parser.add_argument("--scale", default="1M", help="PPD rows to generate, e.g. 1M, 10M, 30M")
+    parser.add_argument("--data-folder", default=None, help="where the synthetic files are kept between runs")
+    parser.add_argument("--stages", nargs="+", default=list(harnesslib.stages), choices=list(harnesslib.stages))
+    parser.add_argument("--chunk-size", type=int, default=250_000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--pipeline", action="store_true", help="overlap parsing, id resolution and inserts")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown or growth, as a fraction")
+    return parser.parse_args()
+
+
+def parse_scale(scale: str) -> int:
+    multipliers = {"K": 1_000, "M": 1_000_000}
+    scale = scale.strip().upper()
+    if scale[-1] in multipliers:
+        return int(float(scale[:-1]) * multipliers[scale[-1]])
+    return int(scale)
+
+
+def ensure_data(data_folder: str, rows: int):
+    # generated once per scale, the marker is written last so a partial generation is redone
+    marker = os.path.join(data_folder, "generated.json")
+    if os.path.isfile(marker):
+        return
+    print(f"generating {rows} rows into {data_folder}", file=sys.stderr)
+    synthlib.write_pdd(os.path.join(data_folder, "pdd"), rows)
+    synthlib.write_ofsted(os.path.join(data_folder, "ofsted"), max(100, int(rows * OFSTED_RATIO)))
+    with open(marker, "w", encoding="utf-8") as fh:
+        json.dump({"rows": rows}, fh)
+
+
+def load_baselines(filepath: str):
+    if not os.path.isfile(filepath):
+        return {}
+    with open(filepath, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def report(results, baseline, tolerance: float):
+    regressions = []
+    print(f"{'stage':<48} {'rows':>10} {'rows/s':>12} {'vs baseline':>12}")
+    for stage, result in results.items():
+        change = ""
+        before = baseline.get(stage)
+        if before and before["rows_per_s"]:
+            ratio = result["rows_per_s"] / before["rows_per_s"]
+            change = f"{ratio - 1:+.1%}"
+            if ratio < 1 - tolerance:
+                regressions.append(stage)
+                change += " !"
+        print(f"{stage:<48} {result['rows']:>10} {result['rows_per_s']:>12,.0f} {change:>12}")
+    return regressions
+
+
+def report_peaks(peaks, baseline, tolerance: float):
+    # memory is only known per process, that is per --stages entry, not per result
+    regressions = []
+    print(f"\n{'process':<48} {'peak MB':>10} {'vs baseline':>12}")
+    for stage, peak in peaks.items():
+        change = ""
+        before = baseline.get(stage)
+        if before:
+            ratio = peak / before
+            change = f"{ratio - 1:+.1%}"
+            if ratio > 1 + tolerance:
+                regressions.append(f"{stage} (peak MB)")
+                change += " !"
+        print(f"{stage:<48} {peak:>10.1f} {change:>12}")
+    return regressions
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,179 @@
+import configparser
+import csv
+import functools
+import importlib.util
+import inspect
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, List
+
+import dblib
+import iolib
+import metricslib
+import ofstedlib
+import pddlib
+
+BLOCK_SIZE = 10_000
+ETL_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl")
+
+# repository entry points timed by the repositories stage, with the argument holding the records
+entry_points = {
+    "ensure_ids_for": 0,
+    "ensure": 0,
+    "records_for": 0,
+    "insert": 0,
+    "link": 0,
+    "touch": 0,
+    "mark": None,
+    "refresh": None,
+}
+
+
+@dataclass
+class Result:
+    stage: str
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "rows_per_s": self.rows_per_s}
+
+
+def etl_main():
+    # etl/__main__.py loaded under another name, so its run() is not triggered
+    spec = importlib.util.spec_from_file_location("etl_main", os.path.join(ETL_FOLDER, "__main__.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def blocks_from(rows, block_size: int = BLOCK_SIZE):
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) >= block_size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def bench_stream(data_folder: str) -> List[Result]:
+    result = Result("stream_csv_from")
+    started = time.perf_counter()
+    for _ in etl_main().stream_csv_from(os.path.join(data_folder, "pdd"), prefix="pp-"):
+        result.rows += 1
+    result.seconds = time.perf_counter() - started
+    return [result]
+
+
+def bench_pdd_transform(data_folder: str, chunk_size: int) -> List[Result]:
+    # reads are excluded: only cleaning the row into a record and piling it into a batch is timed
+    result = Result("pddlib.transform")
+    batch = pddlib.Batch()
+    for filepath in iolib.find_csv_files(os.path.join(data_folder, "pdd"), prefix="pp-"):
+        with iolib.open_text(filepath, encoding="utf-8", progress=False) as filehandle:
+            for block in blocks_from(csv.reader(filehandle)):
+                started = time.perf_counter()
+                for csvrow in block:
+                    batch.add_record(pddlib.record_from(csvrow))
+                result.seconds += time.perf_counter() - started
+                result.rows += len(block)
+                if batch.rows >= chunk_size:
+                    batch = pddlib.Batch()
+    return [result]
+
+
+def bench_ofsted_transform(data_folder: str) -> List[Result]:
+    result = Result("ofstedlib.decode")
+    for filepath in iolib.find_csv_files(os.path.join(data_folder, "ofsted"), prefix="ofsted"):
+        csvrows = iolib.read_csv(filepath, encoding="cp1252", header=True, progress=False)
+        for block in blocks_from(csvrows):
+            started = time.perf_counter()
+            for _ in ofstedlib.decode(block):
+                pass
+            result.seconds += time.perf_counter() - started
+            result.rows += len(block)
+    return [result]
+
+
+def bench_repositories(data_folder: str, chunk_size: int, workers: int, pipeline: bool) -> List[Result]:
+    # the whole load into a fresh SQLite database, timing each repository entry point on the way
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpfolder:
+        config = configparser.ConfigParser()
+        config.read_dict(
+            {
+                "dataset": {
+                    "pdd_folder": os.path.join(data_folder, "pdd"),
+                    "ofsted_folder": os.path.join(data_folder, "ofsted"),
+                },
+                "etl": {
+                    "chunk_size": str(chunk_size),
+                    "workers": str(workers),
+                    "pipeline": str(pipeline).lower(),
+                    "resume": "false",
+                    "backend": "sqlite",
+                },
+                "sqlite": {"database": os.path.join(tmpfolder, "bench.sqlite")},
+            }
+        )
+        repositories = dblib.repositories(config)
+        for f in fields(repositories):
+            repository = getattr(repositories, f.name)
+            if isinstance(repository, dblib.BaseRepository):
+                for name, position in entry_points.items():
+                    if hasattr(repository, name):
+                        result = results[f"repositories.{f.name}.{name}"] = Result(f"repositories.{f.name}.{name}")
+                        setattr(repository, name, timed(getattr(repository, name), result, position))
+        total = Result("repositories")
+        started = time.perf_counter()
+        main = etl_main()
+        main.etl_property_transactions(config, repositories)
+        main.etl_ofsted_statistics(config, repositories)
+        repositories.build_indexes()
+        main.etl_aggregates(config, repositories)
+        repositories.finish()
+        total.seconds = time.perf_counter() - started
+        with repositories.conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT (SELECT COUNT(*) FROM property_transactions) + (SELECT COUNT(*) FROM school_ratings)"
+            )
+            (total.rows,) = cursor.fetchone()
+        repositories.pool.close()
+    return [total] + [r for r in results.values() if r.seconds]
+
+
+def timed(fn, result: Result, position: int = None):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            result.seconds += time.perf_counter() - started
+            result.rows += len(args[position]) if position is not None else 1
+
+    return wrapper
+
+
+stages = {
+    "stream": bench_stream,
+    "pdd": bench_pdd_transform,
+    "ofsted": bench_ofsted_transform,
+    "repositories": bench_repositories,
+}
+
+
+def run_stage(stage: str, **kwargs) -> Dict[str, Any]:
+    # runs in a fresh process, so the peak RSS belongs to this stage alone (to all of its results together)
+    fn = stages[stage]
+    results = fn(**{k: v for (k, v) in kwargs.items() if k in inspect.signature(fn).parameters})
+    peak = metricslib.peak_rss_bytes() / (1024 * 1024)
+    return {"peak_rss_mb": peak, "results": [result.as_dict() for result in results]}
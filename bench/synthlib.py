@@ -0,0 +1,100 @@
+import csv
+import os
+import random
+import uuid
+
+YEARS = list(range(1995, 2023))
+AREAS = ["AL", "B", "BA", "BS", "CB", "E", "LS", "M", "N", "NW", "OX", "SE", "SW", "W", "YO"]
+TOWNS = ["LONDON", "BIRMINGHAM", "LEEDS", "MANCHESTER", "BRISTOL", "OXFORD", "CAMBRIDGE", "YORK", "BATH", "ST. ALBANS"]
+STREETS = ["HIGH STREET", "STATION ROAD", "CHURCH LANE", "MILL LANE", "THE GREEN", "PARK ROAD", "VICTORIA ROAD"]
+PROPERTY_TYPES = "DDSSSTTTTFFFO"
+PHASES = ["Primary", "Secondary", "Special", "Nursery", "Pupil referral unit"]
+# header aliases and cp1252-only characters, as found in the published Ofsted files
+OFSTED_HEADERS = [
+    ["School name", "Postcode", "Phase of education", "Overall effectiveness", "Publication date"],
+    ["School name", "Postcode", "Ofsted phase", "Overall effectiveness", "Publication date"],
+]
+
+
+def postcode_for(i: int) -> str:
+    area = AREAS[i % len(AREAS)]
+    district = (i // len(AREAS)) % 30 + 1
+    sector = (i // (len(AREAS) * 30)) % 10
+    unit = i // (len(AREAS) * 300)
+    return f"{area}{district} {sector}{chr(65 + unit % 26)}{chr(65 + (unit // 26) % 26)}"
+
+
+def property_for(i: int):
+    # properties are derived from their index, so nothing is kept in memory
+    postcode_index = i // 15
+    town = TOWNS[postcode_index % len(TOWNS)]
+    return (
+        postcode_for(postcode_index),
+        PROPERTY_TYPES[i % len(PROPERTY_TYPES)],
+        str(i % 15 + 1) if i % 7 else f"{['ROSE', 'IVY', 'OAK'][i % 3]} COTTAGE",
+        f"FLAT {i % 4 + 1}" if PROPERTY_TYPES[i % len(PROPERTY_TYPES)] == "F" else "",
+        STREETS[postcode_index % len(STREETS)],
+        town if i % 5 else "",
+        town,
+        f"{town} DISTRICT",
+        f"{town} COUNTY",
+    )
+
+
+def write_pdd(folderpath: str, rows: int, seed: int = 42) -> None:
+    # pp-<year>.csv files without header, repeat sales over ~0.8 properties per row
+    rng = random.Random(seed)
+    os.makedirs(folderpath, exist_ok=True)
+    properties = max(1, int(rows * 0.8))
+    per_year = rows // len(YEARS)
+    for n, year in enumerate(YEARS):
+        year_rows = per_year + (rows % len(YEARS) if n == len(YEARS) - 1 else 0)
+        with open(os.path.join(folderpath, f"pp-{year}.csv"), "w", encoding="utf-8", newline="") as fh:
+            writer = csv.writer(fh, quoting=csv.QUOTE_ALL, lineterminator="\n")
+            for _ in range(year_rows):
+                postcode, property_type, paon, saon, street, locality, town, district, county = property_for(
+                    rng.randrange(properties)
+                )
+                writer.writerow(
+                    [
+                        "{" + str(uuid.UUID(int=rng.getrandbits(128))).upper() + "}",
+                        rng.randrange(40_000, 1_500_000, 250),
+                        f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 00:00",
+                        postcode if rng.random() > 0.002 else "",
+                        property_type,
+                        "Y" if rng.random() < 0.1 else "N",
+                        "L" if property_type == "F" else "F",
+                        paon,
+                        saon,
+                        street,
+                        locality,
+                        town,
+                        district,
+                        county,
+                        "A" if rng.random() < 0.97 else "B",
+                        "A",
+                    ]
+                )
+
+
+def write_ofsted(folderpath: str, rows: int, seed: int = 42) -> None:
+    # ofsted-<n>.csv files in cp1252, with blank leading rows and aliased headers
+    rng = random.Random(seed)
+    os.makedirs(folderpath, exist_ok=True)
+    files = len(OFSTED_HEADERS)
+    for n, header in enumerate(OFSTED_HEADERS):
+        with open(os.path.join(folderpath, f"ofsted-{n + 1}.csv"), "w", encoding="cp1252", newline="") as fh:
+            writer = csv.writer(fh, lineterminator="\r\n")
+            writer.writerow([])
+            writer.writerow(header)
+            for _ in range(rows // files):
+                school = rng.randrange(max(1, rows // 3))
+                writer.writerow(
+                    [
+                        f"St Mary’s School {school}" if school % 4 == 0 else f"School {school} – Academy",
+                        postcode_for(school * 7),
+                        PHASES[school % len(PHASES)],
+                        rng.choice(["1", "2", "2", "3", "4", "NULL"]),
+                        f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2005, 2022)}",
+                    ]
+                )
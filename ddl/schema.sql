@@ -4,6 +4,12 @@ CREATE SCHEMA `region_home_school`;
 
 USE `region_home_school`;
 
+DROP TABLE IF EXISTS `stale_postgroups`;
+
+DROP TABLE IF EXISTS `postgroup_ratings`;
+
+DROP TABLE IF EXISTS `postgroup_locality_prices`;
+
 DROP TABLE IF EXISTS `school_ratings`;
 
 DROP TABLE IF EXISTS `education_phases`;
@@ -18,30 +24,73 @@ DROP TABLE IF EXISTS `properties`;
 
 DROP TABLE IF EXISTS `postcodes`;
 
+DROP TABLE IF EXISTS `postcode_sectors`;
+
 DROP TABLE IF EXISTS `postgroups`;
 
+DROP TABLE IF EXISTS `postcode_areas`;
+
+DROP TABLE IF EXISTS `locality_prefixes`;
+
 DROP TABLE IF EXISTS `localities`;
 
+DROP TABLE IF EXISTS `etl_files`;
+
+DROP TABLE IF EXISTS `load_generation_tables`;
+
+DROP TABLE IF EXISTS `load_generations`;
+
 CREATE TABLE `localities` (
     id INT NOT NULL AUTO_INCREMENT,
     name VARCHAR(120) NOT NULL,
+    search_key VARCHAR(120) NOT NULL,
     CONSTRAINT pk_places PRIMARY KEY (`id`),
-    UNIQUE INDEX ix_places_name (`name`)
+    UNIQUE INDEX ix_places_name (`name`),
+    INDEX ix_places_search_key (`search_key`)
+);
+
+CREATE TABLE `locality_prefixes` (
+    prefix VARCHAR(12) NOT NULL,
+    locality_id INT NOT NULL,
+    CONSTRAINT pk_locality_prefixes PRIMARY KEY (`prefix`, `locality_id`),
+    CONSTRAINT fk_locality_prefixes_locality_id FOREIGN KEY (`locality_id`) REFERENCES `localities` (`id`)
+);
+
+CREATE TABLE `postcode_areas` (
+    id INT NOT NULL AUTO_INCREMENT,
+    name VARCHAR(10) NOT NULL,
+    CONSTRAINT pk_postcode_areas PRIMARY KEY (`id`),
+    UNIQUE INDEX ix_postcode_areas_name (`name`)
 );
 
 CREATE TABLE `postgroups` (
     id INT NOT NULL AUTO_INCREMENT,
-    name VARCHAR(5) NOT NULL,
+    area_id INT NOT NULL,
+    name VARCHAR(10) NOT NULL,
     CONSTRAINT pk_postgroups PRIMARY KEY (`id`),
+    CONSTRAINT fk_postgroups_area_id FOREIGN KEY (`area_id`) REFERENCES `postcode_areas` (`id`),
     UNIQUE INDEX ix_postgroups_name (`name`)
 );
 
+CREATE TABLE `postcode_sectors` (
+    id INT NOT NULL AUTO_INCREMENT,
+    postgroup_id INT NOT NULL,
+    name VARCHAR(12) NOT NULL,
+    CONSTRAINT pk_postcode_sectors PRIMARY KEY (`id`),
+    CONSTRAINT fk_postcode_sectors_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`),
+    UNIQUE INDEX ix_postcode_sectors_name (`name`)
+);
+
 CREATE TABLE `postcodes` (
     id INT NOT NULL AUTO_INCREMENT,
+    area_id INT NOT NULL,
     postgroup_id INT NOT NULL,
+    sector_id INT NOT NULL,
     name VARCHAR(10) NOT NULL,
     CONSTRAINT pk_postcodes PRIMARY KEY (`id`),
+    CONSTRAINT fk_postcodes_area_id FOREIGN KEY (`area_id`) REFERENCES `postcode_areas` (`id`),
     CONSTRAINT fk_postcodes_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`),
+    CONSTRAINT fk_postcodes_sector_id FOREIGN KEY (`sector_id`) REFERENCES `postcode_sectors` (`id`),
     UNIQUE INDEX ix_postgroups_name (`name`)
 );
 
@@ -93,10 +142,52 @@ CREATE TABLE `property_transactions` (
     tenure_id INT NOT NULL,
     price DECIMAL NOT NULL,
     ts TIMESTAMP NOT NULL,
-    CONSTRAINT pk_property_transactions PRIMARY KEY (`id`),
-    CONSTRAINT fk_property_transactions_tenure FOREIGN KEY (`tenure_id`) REFERENCES `tenures` (`id`),
-    CONSTRAINT fk_property_transactions_property_id FOREIGN KEY (`property_id`) REFERENCES `properties` (`id`),
-    UNIQUE INDEX ix_property_transactions (`property_id`, `new_build`, `tenure_id`, `ts`)
+    guid CHAR(38) NULL,
+    -- partitioned by year: unique keys include ts, and partitioned tables take no foreign keys
+    CONSTRAINT pk_property_transactions PRIMARY KEY (`id`, `ts`),
+    UNIQUE INDEX ix_property_transactions (`property_id`, `new_build`, `tenure_id`, `ts`),
+    UNIQUE INDEX ix_property_transactions_guid (`guid`, `ts`),
+    INDEX ix_property_transactions_tenure_id (`tenure_id`)
+)
+PARTITION BY RANGE (UNIX_TIMESTAMP(`ts`)) (
+    PARTITION pmin VALUES LESS THAN (UNIX_TIMESTAMP('1995-01-01 00:00:00')),
+    PARTITION p1995 VALUES LESS THAN (UNIX_TIMESTAMP('1996-01-01 00:00:00')),
+    PARTITION p1996 VALUES LESS THAN (UNIX_TIMESTAMP('1997-01-01 00:00:00')),
+    PARTITION p1997 VALUES LESS THAN (UNIX_TIMESTAMP('1998-01-01 00:00:00')),
+    PARTITION p1998 VALUES LESS THAN (UNIX_TIMESTAMP('1999-01-01 00:00:00')),
+    PARTITION p1999 VALUES LESS THAN (UNIX_TIMESTAMP('2000-01-01 00:00:00')),
+    PARTITION p2000 VALUES LESS THAN (UNIX_TIMESTAMP('2001-01-01 00:00:00')),
+    PARTITION p2001 VALUES LESS THAN (UNIX_TIMESTAMP('2002-01-01 00:00:00')),
+    PARTITION p2002 VALUES LESS THAN (UNIX_TIMESTAMP('2003-01-01 00:00:00')),
+    PARTITION p2003 VALUES LESS THAN (UNIX_TIMESTAMP('2004-01-01 00:00:00')),
+    PARTITION p2004 VALUES LESS THAN (UNIX_TIMESTAMP('2005-01-01 00:00:00')),
+    PARTITION p2005 VALUES LESS THAN (UNIX_TIMESTAMP('2006-01-01 00:00:00')),
+    PARTITION p2006 VALUES LESS THAN (UNIX_TIMESTAMP('2007-01-01 00:00:00')),
+    PARTITION p2007 VALUES LESS THAN (UNIX_TIMESTAMP('2008-01-01 00:00:00')),
+    PARTITION p2008 VALUES LESS THAN (UNIX_TIMESTAMP('2009-01-01 00:00:00')),
+    PARTITION p2009 VALUES LESS THAN (UNIX_TIMESTAMP('2010-01-01 00:00:00')),
+    PARTITION p2010 VALUES LESS THAN (UNIX_TIMESTAMP('2011-01-01 00:00:00')),
+    PARTITION p2011 VALUES LESS THAN (UNIX_TIMESTAMP('2012-01-01 00:00:00')),
+    PARTITION p2012 VALUES LESS THAN (UNIX_TIMESTAMP('2013-01-01 00:00:00')),
+    PARTITION p2013 VALUES LESS THAN (UNIX_TIMESTAMP('2014-01-01 00:00:00')),
+    PARTITION p2014 VALUES LESS THAN (UNIX_TIMESTAMP('2015-01-01 00:00:00')),
+    PARTITION p2015 VALUES LESS THAN (UNIX_TIMESTAMP('2016-01-01 00:00:00')),
+    PARTITION p2016 VALUES LESS THAN (UNIX_TIMESTAMP('2017-01-01 00:00:00')),
+    PARTITION p2017 VALUES LESS THAN (UNIX_TIMESTAMP('2018-01-01 00:00:00')),
+    PARTITION p2018 VALUES LESS THAN (UNIX_TIMESTAMP('2019-01-01 00:00:00')),
+    PARTITION p2019 VALUES LESS THAN (UNIX_TIMESTAMP('2020-01-01 00:00:00')),
+    PARTITION p2020 VALUES LESS THAN (UNIX_TIMESTAMP('2021-01-01 00:00:00')),
+    PARTITION p2021 VALUES LESS THAN (UNIX_TIMESTAMP('2022-01-01 00:00:00')),
+    PARTITION p2022 VALUES LESS THAN (UNIX_TIMESTAMP('2023-01-01 00:00:00')),
+    PARTITION p2023 VALUES LESS THAN (UNIX_TIMESTAMP('2024-01-01 00:00:00')),
+    PARTITION p2024 VALUES LESS THAN (UNIX_TIMESTAMP('2025-01-01 00:00:00')),
+    PARTITION p2025 VALUES LESS THAN (UNIX_TIMESTAMP('2026-01-01 00:00:00')),
+    PARTITION p2026 VALUES LESS THAN (UNIX_TIMESTAMP('2027-01-01 00:00:00')),
+    PARTITION p2027 VALUES LESS THAN (UNIX_TIMESTAMP('2028-01-01 00:00:00')),
+    PARTITION p2028 VALUES LESS THAN (UNIX_TIMESTAMP('2029-01-01 00:00:00')),
+    PARTITION p2029 VALUES LESS THAN (UNIX_TIMESTAMP('2030-01-01 00:00:00')),
+    PARTITION p2030 VALUES LESS THAN (UNIX_TIMESTAMP('2031-01-01 00:00:00')),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
 );
 
 CREATE TABLE `education_phases` (
@@ -130,4 +221,57 @@ CREATE TABLE `school_ratings` (
         `rating`,
         `ts`
     )
-);
\ No newline at end of file
+);
+
+CREATE TABLE `postgroup_locality_prices` (
+    postgroup_id INT NOT NULL,
+    locality_id INT NOT NULL,
+    average_price DECIMAL(14, 4) NOT NULL,
+    transactions INT NOT NULL,
+    CONSTRAINT pk_postgroup_locality_prices PRIMARY KEY (`postgroup_id`, `locality_id`),
+    CONSTRAINT fk_postgroup_locality_prices_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`),
+    CONSTRAINT fk_postgroup_locality_prices_locality_id FOREIGN KEY (`locality_id`) REFERENCES `localities` (`id`),
+    INDEX ix_postgroup_locality_prices_locality_id (`locality_id`),
+    INDEX ix_postgroup_locality_prices_average_price (`average_price`)
+);
+
+CREATE TABLE `postgroup_ratings` (
+    postgroup_id INT NOT NULL,
+    average_rating DOUBLE NOT NULL,
+    ratings INT NOT NULL,
+    CONSTRAINT pk_postgroup_ratings PRIMARY KEY (`postgroup_id`),
+    CONSTRAINT fk_postgroup_ratings_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`)
+);
+
+CREATE TABLE `stale_postgroups` (
+    postgroup_id INT NOT NULL,
+    CONSTRAINT pk_stale_postgroups PRIMARY KEY (`postgroup_id`),
+    CONSTRAINT fk_stale_postgroups_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`)
+);
+
+CREATE TABLE `etl_files` (
+    id INT NOT NULL AUTO_INCREMENT,
+    path VARCHAR(1024) NOT NULL,
+    size BIGINT NOT NULL,
+    mtime DOUBLE NOT NULL,
+    fingerprint CHAR(64) NOT NULL,
+    bytes_committed BIGINT NOT NULL,
+    completed BOOLEAN NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_etl_files PRIMARY KEY (`id`),
+    UNIQUE INDEX ix_etl_files_fingerprint (`fingerprint`)
+);
+
+CREATE TABLE `load_generations` (
+    id INT NOT NULL AUTO_INCREMENT,
+    completed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_load_generations PRIMARY KEY (`id`)
+);
+
+CREATE TABLE `load_generation_tables` (
+    generation_id INT NOT NULL,
+    table_name VARCHAR(64) NOT NULL,
+    row_count BIGINT NOT NULL,
+    CONSTRAINT pk_load_generation_tables PRIMARY KEY (`generation_id`, `table_name`),
+    CONSTRAINT fk_load_generation_tables_generation_id FOREIGN KEY (`generation_id`) REFERENCES `load_generations` (`id`)
+);
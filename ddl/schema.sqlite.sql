@@ -0,0 +1,230 @@
+-- SQLite counterpart of schema.sql, created by the etl on an empty database file (backend=sqlite).
+-- Unique keys stay on the tables (inserts rely on them to skip duplicates), and so do the indexes the
+-- load itself reads; the indexes after the `-- deferred` line are built by the etl once the facts are loaded.
+
+CREATE TABLE `localities` (
+    id INTEGER NOT NULL,
+    name VARCHAR(120) NOT NULL,
+    search_key VARCHAR(120) NOT NULL,
+    CONSTRAINT pk_places PRIMARY KEY (`id`),
+    CONSTRAINT ix_places_name UNIQUE (`name`)
+);
+
+CREATE TABLE `locality_prefixes` (
+    prefix VARCHAR(12) NOT NULL,
+    locality_id INTEGER NOT NULL,
+    CONSTRAINT pk_locality_prefixes PRIMARY KEY (`prefix`, `locality_id`),
+    CONSTRAINT fk_locality_prefixes_locality_id FOREIGN KEY (`locality_id`) REFERENCES `localities` (`id`)
+);
+
+CREATE TABLE `postcode_areas` (
+    id INTEGER NOT NULL,
+    name VARCHAR(10) NOT NULL,
+    CONSTRAINT pk_postcode_areas PRIMARY KEY (`id`),
+    CONSTRAINT ix_postcode_areas_name UNIQUE (`name`)
+);
+
+CREATE TABLE `postgroups` (
+    id INTEGER NOT NULL,
+    area_id INTEGER NOT NULL,
+    name VARCHAR(10) NOT NULL,
+    CONSTRAINT pk_postgroups PRIMARY KEY (`id`),
+    CONSTRAINT fk_postgroups_area_id FOREIGN KEY (`area_id`) REFERENCES `postcode_areas` (`id`),
+    CONSTRAINT ix_postgroups_name UNIQUE (`name`)
+);
+
+CREATE TABLE `postcode_sectors` (
+    id INTEGER NOT NULL,
+    postgroup_id INTEGER NOT NULL,
+    name VARCHAR(12) NOT NULL,
+    CONSTRAINT pk_postcode_sectors PRIMARY KEY (`id`),
+    CONSTRAINT fk_postcode_sectors_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`),
+    CONSTRAINT ix_postcode_sectors_name UNIQUE (`name`)
+);
+
+CREATE TABLE `postcodes` (
+    id INTEGER NOT NULL,
+    area_id INTEGER NOT NULL,
+    postgroup_id INTEGER NOT NULL,
+    sector_id INTEGER NOT NULL,
+    name VARCHAR(10) NOT NULL,
+    CONSTRAINT pk_postcodes PRIMARY KEY (`id`),
+    CONSTRAINT fk_postcodes_area_id FOREIGN KEY (`area_id`) REFERENCES `postcode_areas` (`id`),
+    CONSTRAINT fk_postcodes_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`),
+    CONSTRAINT fk_postcodes_sector_id FOREIGN KEY (`sector_id`) REFERENCES `postcode_sectors` (`id`),
+    CONSTRAINT ix_postcodes_name UNIQUE (`name`)
+);
+
+CREATE TABLE `localities_postcodes` (
+    locality_id INTEGER NOT NULL,
+    postcode_id INTEGER NOT NULL,
+    CONSTRAINT pk_places_postgroups PRIMARY KEY (`locality_id`, `postcode_id`),
+    CONSTRAINT fk_places_postgroups_place_id FOREIGN KEY (`locality_id`) REFERENCES `localities` (`id`),
+    CONSTRAINT fk_places_postgroups_postgroup_id FOREIGN KEY (`postcode_id`) REFERENCES `postcodes` (`id`)
+);
+
+CREATE TABLE `property_types` (
+    id INTEGER NOT NULL,
+    name VARCHAR(120) NOT NULL,
+    CONSTRAINT pk_property_types PRIMARY KEY (`id`)
+);
+
+CREATE INDEX ix_property_types_name ON `property_types` (`name`);
+
+CREATE TABLE `properties` (
+    id INTEGER NOT NULL,
+    number_or_name VARCHAR(120) NOT NULL,
+    building_ref VARCHAR(120) NOT NULL,
+    street_name VARCHAR(120) NOT NULL,
+    postcode_id INTEGER NOT NULL,
+    property_type_id INTEGER NOT NULL,
+    CONSTRAINT pk_properties PRIMARY KEY (`id`),
+    CONSTRAINT fk_properties_postcode_id FOREIGN KEY (`postcode_id`) REFERENCES `postcodes` (`id`),
+    CONSTRAINT fk_properties_property_type_id FOREIGN KEY (`property_type_id`) REFERENCES `property_types` (`id`),
+    CONSTRAINT ix_properties UNIQUE (
+        `number_or_name`,
+        `building_ref`,
+        `street_name`,
+        `postcode_id`,
+        `property_type_id`
+    )
+);
+
+-- new property ids are read back by postcode after every chunk
+CREATE INDEX ix_properties_postcode_id ON `properties` (`postcode_id`);
+
+CREATE TABLE `tenures` (
+    id INTEGER NOT NULL,
+    name VARCHAR(120) NOT NULL,
+    CONSTRAINT pk_tenures PRIMARY KEY (`id`)
+);
+
+CREATE INDEX ix_tenures_name ON `tenures` (`name`);
+
+CREATE TABLE `property_transactions` (
+    id INTEGER NOT NULL,
+    property_id INTEGER NOT NULL,
+    new_build BOOLEAN NOT NULL,
+    tenure_id INTEGER NOT NULL,
+    price DECIMAL NOT NULL,
+    ts TIMESTAMP NOT NULL,
+    guid CHAR(38) NULL,
+    CONSTRAINT pk_property_transactions PRIMARY KEY (`id`),
+    CONSTRAINT fk_property_transactions_tenure FOREIGN KEY (`tenure_id`) REFERENCES `tenures` (`id`),
+    CONSTRAINT fk_property_transactions_property_id FOREIGN KEY (`property_id`) REFERENCES `properties` (`id`),
+    CONSTRAINT ix_property_transactions UNIQUE (`property_id`, `new_build`, `tenure_id`, `ts`),
+    CONSTRAINT ix_property_transactions_guid UNIQUE (`guid`, `ts`)
+);
+
+CREATE TABLE `education_phases` (
+    id INTEGER NOT NULL,
+    name VARCHAR(120) NOT NULL,
+    CONSTRAINT pk_education_phases PRIMARY KEY (`id`),
+    CONSTRAINT ix_education_phases_name UNIQUE (`name`)
+);
+
+CREATE TABLE `schools` (
+    id INTEGER NOT NULL,
+    name VARCHAR(120) NOT NULL,
+    postcode_id INTEGER NOT NULL,
+    CONSTRAINT pk_schools PRIMARY KEY (`id`),
+    CONSTRAINT fk_schools_postcode_id FOREIGN KEY (`postcode_id`) REFERENCES `postcodes` (`id`),
+    CONSTRAINT ix_school UNIQUE (`name`, `postcode_id`)
+);
+
+CREATE TABLE `school_ratings` (
+    id INTEGER NOT NULL,
+    school_id INTEGER NOT NULL,
+    education_phase_id INTEGER NOT NULL,
+    rating FLOAT NOT NULL,
+    ts TIMESTAMP NOT NULL,
+    CONSTRAINT pk_school_ratings PRIMARY KEY (`id`),
+    CONSTRAINT fk_school_ratings_school_id FOREIGN KEY (`school_id`) REFERENCES `schools` (`id`),
+    CONSTRAINT fk_school_ratings_education_phase_id FOREIGN KEY (`education_phase_id`) REFERENCES `education_phases` (`id`),
+    CONSTRAINT ix_school_ratings UNIQUE (
+        `school_id`,
+        `education_phase_id`,
+        `rating`,
+        `ts`
+    )
+);
+
+CREATE TABLE `postgroup_locality_prices` (
+    postgroup_id INTEGER NOT NULL,
+    locality_id INTEGER NOT NULL,
+    average_price DECIMAL(14, 4) NOT NULL,
+    transactions INTEGER NOT NULL,
+    CONSTRAINT pk_postgroup_locality_prices PRIMARY KEY (`postgroup_id`, `locality_id`),
+    CONSTRAINT fk_postgroup_locality_prices_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`),
+    CONSTRAINT fk_postgroup_locality_prices_locality_id FOREIGN KEY (`locality_id`) REFERENCES `localities` (`id`)
+);
+
+CREATE TABLE `postgroup_ratings` (
+    postgroup_id INTEGER NOT NULL,
+    average_rating DOUBLE NOT NULL,
+    ratings INTEGER NOT NULL,
+    CONSTRAINT pk_postgroup_ratings PRIMARY KEY (`postgroup_id`),
+    CONSTRAINT fk_postgroup_ratings_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`)
+);
+
+CREATE TABLE `stale_postgroups` (
+    postgroup_id INTEGER NOT NULL,
+    CONSTRAINT pk_stale_postgroups PRIMARY KEY (`postgroup_id`),
+    CONSTRAINT fk_stale_postgroups_postgroup_id FOREIGN KEY (`postgroup_id`) REFERENCES `postgroups` (`id`)
+);
+
+CREATE TABLE `etl_files` (
+    id INTEGER NOT NULL,
+    path VARCHAR(1024) NOT NULL,
+    size BIGINT NOT NULL,
+    mtime DOUBLE NOT NULL,
+    fingerprint CHAR(64) NOT NULL,
+    bytes_committed BIGINT NOT NULL,
+    completed BOOLEAN NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_etl_files PRIMARY KEY (`id`),
+    CONSTRAINT ix_etl_files_fingerprint UNIQUE (`fingerprint`)
+);
+
+CREATE TABLE `load_generations` (
+    id INTEGER NOT NULL,
+    completed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_load_generations PRIMARY KEY (`id`)
+);
+
+CREATE TABLE `load_generation_tables` (
+    generation_id INTEGER NOT NULL,
+    table_name VARCHAR(64) NOT NULL,
+    row_count BIGINT NOT NULL,
+    CONSTRAINT pk_load_generation_tables PRIMARY KEY (`generation_id`, `table_name`),
+    CONSTRAINT fk_load_generation_tables_generation_id FOREIGN KEY (`generation_id`) REFERENCES `load_generations` (`id`)
+);
+
+-- deferred
+-- the foreign keys (which MySQL indexes on its own) and the summaries, read by the aggregates and web queries
+
+CREATE INDEX ix_places_search_key ON `localities` (`search_key`);
+
+CREATE INDEX ix_postgroups_area_id ON `postgroups` (`area_id`);
+
+CREATE INDEX ix_postcode_sectors_postgroup_id ON `postcode_sectors` (`postgroup_id`);
+
+CREATE INDEX ix_postcodes_area_id ON `postcodes` (`area_id`);
+
+CREATE INDEX ix_postcodes_postgroup_id ON `postcodes` (`postgroup_id`);
+
+CREATE INDEX ix_postcodes_sector_id ON `postcodes` (`sector_id`);
+
+CREATE INDEX ix_localities_postcodes_postcode_id ON `localities_postcodes` (`postcode_id`);
+
+CREATE INDEX ix_properties_property_type_id ON `properties` (`property_type_id`);
+
+CREATE INDEX ix_property_transactions_tenure_id ON `property_transactions` (`tenure_id`);
+
+CREATE INDEX ix_schools_postcode_id ON `schools` (`postcode_id`);
+
+CREATE INDEX ix_school_ratings_education_phase_id ON `school_ratings` (`education_phase_id`);
+
+CREATE INDEX ix_postgroup_locality_prices_locality_id ON `postgroup_locality_prices` (`locality_id`);
+
+CREATE INDEX ix_postgroup_locality_prices_average_price ON `postgroup_locality_prices` (`average_price`);
@@ -1,20 +1,46 @@
 import configparser
-import csv
+import functools
 import os
 import shutil
 
-import tqdm
+from tqdm import tqdm
 
+import columnlib
 import dblib
+import iolib
+import metricslib
+import parselib
+import pipelib
 import pddlib
-import ofstedlib
+import postcodelib
+
+CHUNK_SIZE = 250_000
+RANGE_SIZE = 16 * 1024 * 1024
 
 
 def run():
     config = get_config()
-    repositories = dblib.repositories(config)
-    etl_property_transactions(config, repositories)
-    etl_ofsted_statistics(config, repositories)
+    metrics = metricslib.metrics
+    metrics.configure(config)
+    try:
+        repositories = dblib.repositories(config)
+        with metrics.stage("property_transactions"):
+            etl_property_transactions(config, repositories)
+        with metrics.stage("ofsted_statistics"):
+            etl_ofsted_statistics(config, repositories)
+        with metrics.stage("indexes"):
+            repositories.build_indexes()
+        with metrics.stage("aggregates"):
+            etl_aggregates(config, repositories)
+        repositories.save_caches()
+        # last: the web tier keeps serving cached results until a new generation is published
+        with metrics.stage("publish"):
+            repositories.generations.publish()
+            repositories.commit()
+        repositories.finish()
+    finally:
+        # written on failures too, to see how far the run went and where the time went
+        metrics.emit()
 
 
 def get_config():
@@ -27,82 +53,150 @@ def get_config():
 
 
 def etl_property_transactions(config, repositories: dblib.Repositories):
-    pdd_csvrows = stream_csv_from(folderpath=config["dataset"]["pdd_folder"], prefix="pp-")
-    pdd_postgroups = set()
-    pdd_postcodes = set()
-    pdd_localities = set()
-    pdd_property_types = set()
-    pdd_tenures = set()
-    pdd_properties = set()
-    pdd_locality_postcodes = set()
-    pdd_transactions = set()
-    for _, pdd_csvrow in pdd_csvrows:
-        # capture
-        pdd_csvrow = pddlib.fix_critical_positions(pdd_csvrow)
-        pdd_row_locality = pddlib.get_localities_from(pdd_csvrow)
-        pdd_row_postcode = pddlib.get_postcode_from(pdd_csvrow)
-        pdd_row_locality_postcode = pddlib.get_locality_postcodes_from(pdd_csvrow)
-        pdd_row_postgroup = pdd_row_postcode.split(" ")[0]
-        pdd_row_property_type = pddlib.get_property_type_from(pdd_csvrow)
-        pdd_row_tenure = pddlib.get_tenure_from(pdd_csvrow)
-        pdd_row_property = pddlib.get_property_from(pdd_csvrow)
-        pdd_row_transaction = pddlib.get_transaction_from(pdd_csvrow)
-        # pile up
-        pdd_postcodes.add(pdd_row_postcode)
-        pdd_postgroups.add(pdd_row_postgroup)
-        pdd_localities.add(pdd_row_locality)
-        pdd_locality_postcodes.add(pdd_row_locality_postcode)
-        pdd_property_types.add(pdd_row_property_type)
-        pdd_tenures.add(pdd_row_tenure)
-        pdd_properties.add(pdd_row_property)
-        pdd_transactions.add(pdd_row_transaction)
-    # store and get ids
-    map_locality_ids = repositories.localities.ensure_ids_for(pdd_localities)
-    map_postgroups_ids = repositories.postgroups.ensure_ids_for(pdd_postgroups)
-    map_postcodes_ids = repositories.postcodes.ensure_ids_for(pdd_postcodes, map_postgroups_ids)
-    repositories.localities_postgroups.link(pdd_locality_postcodes, map_locality_ids, map_postcodes_ids)
-    map_propert_type_ids = repositories.property_types.ensure_ids_for(pdd_property_types)
-    map_property_ids = repositories.properties.ensure_ids_for(pdd_properties, map_postcodes_ids, map_propert_type_ids)
-    map_tenure_ids = repositories.tenures.ensure_ids_for(pdd_tenures)
-    repositories.transactions.ensure(pdd_transactions, map_property_ids, map_tenure_ids)
-    repositories.commit()
+    pdd_files = [iolib.describe(fp) for fp in iolib.find_csv_files(config["dataset"]["pdd_folder"], prefix="pp-")]
+    chunk_size = config.getint("etl", "chunk_size", fallback=CHUNK_SIZE)
+    range_size = config.getint("etl", "range_size", fallback=RANGE_SIZE)
+    workers = config.getint("etl", "workers", fallback=1)
+    resume = config.getboolean("etl", "resume", fallback=True)
+    parse_cache_folder = config.get("etl", "parse_cache_folder", fallback=None) or None
+    cdc = config.getboolean("etl", "cdc", fallback=False)
+    # resuming: completed files are skipped, partly loaded ones restart after their last committed chunk
+    pdd_tasks = []
+    for pdd_file in pdd_files:
+        committed = repositories.manifest.committed(pdd_file) if resume else 0
+        for start, end in iolib.split_ranges(pdd_file.path, range_size, committed):
+            cache_path = parse_cache_path(parse_cache_folder, pdd_file, f"{start}-{end}")
+            pdd_tasks.append((pdd_file.path, start, end, cache_path))
+    pdd_partials = parselib.parse_pdd_tasks(pdd_tasks, workers)
+    total = sum(end - start for (_, start, end, _) in pdd_tasks)
+    pdd_files = {pdd_file.path: pdd_file for pdd_file in pdd_files}
+    pdd_batches = merge_batches_from(pdd_partials, chunk_size)
+    resolve = functools.partial(resolve_pdd_batch, repositories)
+    with tqdm(desc="pp-*", total=total, unit="B", unit_scale=True) as progress:
+        for pdd_resolved in pipeline_from(config, pdd_batches, [resolve]):
+            committed, rows, size, transactions, deletes, postgroup_ids = pdd_resolved
+            with repositories.lock:
+                # change data capture: changed and deleted transactions are deleted by GUID, changes re-added;
+                # the postgroups they leave are stale too
+                if cdc:
+                    postgroup_ids = postgroup_ids | repositories.transactions.postgroup_ids_for(deletes)
+                repositories.transactions.insert(transactions, deletes if cdc else [])
+                repositories.aggregates.touch(postgroup_ids)
+                # checkpoint, committed together with the chunk
+                for filepath, committed_bytes in committed.items():
+                    repositories.manifest.mark(pdd_files[filepath], committed_bytes)
+                repositories.commit()
+            metricslib.metrics.get("property_transactions").add(rows=rows, bytes=size)
+            # per file: how far into the file the chunk ended
+            if committed:
+                filepath, committed_bytes = list(committed.items())[-1]
+                done = committed_bytes / max(1, pdd_files[filepath].size)
+                progress.set_postfix_str(f"{os.path.basename(filepath)} {done:.0%}", refresh=False)
+            progress.update(size)
+    # years loaded anew (partition_loading) are swapped into their partitions once all their rows are in
+    with repositories.lock:
+        repositories.transactions.flush()
+
+
+def resolve_pdd_batch(repositories: dblib.Repositories, pdd_batch: pddlib.Batch):
+    # store and get ids, down to the transaction rows ready to insert
+    levels = postcodelib.levels_for(pdd_batch.postcodes)
+    with repositories.lock:
+        # independent dimensions first (concurrently, when pooled)
+        map_locality_ids, map_area_ids, map_propert_type_ids, map_tenure_ids = repositories.concurrently(
+            (repositories.localities.ensure_ids_for, (pdd_batch.localities,)),
+            (repositories.postcode_areas.ensure_ids_for, (levels.values(),)),
+            (repositories.property_types.ensure_ids_for, (pdd_batch.property_types,)),
+            (repositories.tenures.ensure_ids_for, (pdd_batch.tenures,)),
+        )
+        # postcode levels, each referencing the one above
+        map_postgroups_ids = repositories.postgroups.ensure_ids_for(levels.values(), map_area_ids)
+        map_sector_ids = repositories.postcode_sectors.ensure_ids_for(levels.values(), map_postgroups_ids)
+        map_postcodes_ids = repositories.postcodes.ensure_ids_for(
+            levels, map_area_ids, map_postgroups_ids, map_sector_ids
+        )
+        repositories.localities_postgroups.link(pdd_batch.locality_postcodes, map_locality_ids, map_postcodes_ids)
+        # records carry property type and tenure codes
+        map_propert_type_ids = pddlib.ids_by_code(pddlib.property_types, map_propert_type_ids)
+        map_tenure_ids = pddlib.ids_by_code(pddlib.tenures, map_tenure_ids)
+        map_property_ids = repositories.properties.ensure_ids_for(
+            pdd_batch.properties, map_postcodes_ids, map_propert_type_ids
+        )
+        transactions = pdd_batch.transactions.values()
+        deletes = repositories.transactions.deletes_for(transactions)
+        transactions = repositories.transactions.records_for(transactions, map_property_ids, map_tenure_ids)
+    postgroup_ids = set(map_postgroups_ids.values())
+    return pdd_batch.committed(), pdd_batch.rows, pdd_batch.bytes, transactions, deletes, postgroup_ids
+
+
+def pipeline_from(config, source, stages):
+    # pipelined: parsing, id resolution and inserts overlap in threads, with bounded queues between them
+    if config.getboolean("etl", "pipeline", fallback=False):
+        return pipelib.run(source, stages, config.getint("etl", "pipeline_queue_size", fallback=2))
+    return pipelib.sequential(source, stages)
+
+
+def merge_batches_from(pdd_partials, chunk_size: int):
+    # bounded memory: partial results are merged up to about `chunk_size` rows at a time
+    pdd_batch = pddlib.Batch()
+    for pdd_partial in pdd_partials:
+        pdd_batch.merge(pdd_partial)
+        if pdd_batch.rows >= chunk_size:
+            yield pdd_batch
+            pdd_batch = pddlib.Batch()
+    if pdd_batch.ranges:
+        yield pdd_batch
 
 
 def etl_ofsted_statistics(config, repositories: dblib.Repositories):
-    ofsted_csvrows = stream_csv_from(folderpath=config["dataset"]["ofsted_folder"], encoding="cp1252", prefix="ofsted", header=True)
-    ofsted_records = [ofstedlib.transform(h, r) for (h, r) in ofsted_csvrows]
-    ofsted_records = [r for r in ofsted_records if r]
-    # collect
-    ofsted_education_phases = ofstedlib.get_education_phases_from(ofsted_records)
-    ofsted_schools = ofstedlib.get_schools_from(ofsted_records)
-    ofsted_school_ratings = ofstedlib.get_school_ratings_from(ofsted_records)
-    map_postcode_ids = repositories.postcodes.get_ids()
-    # store and get ids
-    map_education_phase_ids = repositories.education_phases.ensure_ids_for(ofsted_education_phases)
-    map_school_ids = repositories.schools.ensure_ids_for(ofsted_schools, map_postcode_ids)
-    repositories.ratings.ensure(ofsted_school_ratings, map_school_ids, map_education_phase_ids)
+    ofsted_files = [iolib.describe(fp) for fp in iolib.find_csv_files(config["dataset"]["ofsted_folder"], "ofsted")]
+    workers = config.getint("etl", "workers", fallback=1)
+    resume = config.getboolean("etl", "resume", fallback=True)
+    if resume:
+        ofsted_files = [f for f in ofsted_files if repositories.manifest.committed(f) < f.size]
+    parse_cache_folder = config.get("etl", "parse_cache_folder", fallback=None) or None
+    ofsted_tasks = [(f.path, parse_cache_path(parse_cache_folder, f, "all")) for f in ofsted_files]
+    ofsted_partials = parselib.imap(parselib.parse_ofsted_file, ofsted_tasks, workers)
+    resolve = functools.partial(resolve_ofsted_batch, repositories)
+    ofsted_resolved = pipeline_from(config, zip(ofsted_files, ofsted_partials), [resolve])
+    for ofsted_file, ratings, postgroup_ids in tqdm(ofsted_resolved, desc="ofsted*", total=len(ofsted_files)):
+        with repositories.lock:
+            repositories.ratings.insert(ratings)
+            repositories.aggregates.touch(postgroup_ids)
+            # checkpoint, committed together with the file
+            repositories.manifest.mark(ofsted_file, ofsted_file.size)
+            repositories.commit()
+        metricslib.metrics.get("ofsted_statistics").add(rows=len(ratings), bytes=ofsted_file.size)
+
+
+def resolve_ofsted_batch(repositories: dblib.Repositories, ofsted_partial):
+    ofsted_file, ofsted_batch = ofsted_partial
+    with repositories.lock:
+        # store and get ids
+        map_postcode_ids, map_education_phase_ids = repositories.concurrently(
+            (repositories.postcodes.get_ids_for, (set(pc for (pc, _) in ofsted_batch.schools),)),
+            (repositories.education_phases.ensure_ids_for, (ofsted_batch.education_phases,)),
+        )
+        map_school_ids = repositories.schools.ensure_ids_for(ofsted_batch.schools, map_postcode_ids)
+        ratings = repositories.ratings.records_for(ofsted_batch.school_ratings, map_school_ids, map_education_phase_ids)
+        districts = set(l.district for l in postcodelib.levels_for(map_postcode_ids).values())
+        map_postgroup_ids = repositories.postgroups.get_ids_for(districts)
+    return ofsted_file, ratings, set(map_postgroup_ids.values())
+
+
+def etl_aggregates(config, repositories: dblib.Repositories):
+    # summaries read by the web queries, recomputed only for postgroups touched since the last refresh
+    repositories.aggregates.refresh()
     repositories.commit()
 
 
+def parse_cache_path(parse_cache_folder: str, source_file: iolib.SourceFile, part: str):
+    return columnlib.path_for(parse_cache_folder, source_file.fingerprint, part) if parse_cache_folder else None
+
+
 def stream_csv_from(folderpath, encoding: str = "utf-8", prefix: str = None, header: bool = False):
-    csvheader = None
-    total = 0
-    for root, _, filenames in os.walk(folderpath):
-        for filename in filenames:
-            if (not prefix or filename.startswith(prefix)) and filename.endswith(".csv"):
-                filepath = os.path.join(root, filename)
-                with open(filepath, "r", encoding=encoding) as filehandle:
-                    total = sum(1 for _ in filehandle) - (1 if header else 0)
-                with open(filepath, "r", encoding=encoding) as filehandle:
-                    spamreader = csv.reader(filehandle)
-                    if header:
-                        csvheader = next(spamreader, None)
-                        while not csvheader or not csvheader[0]:
-                            csvheader = next(spamreader, None)
-                        if csvheader:
-                            csvheader = [h.upper() for h in csvheader]
-                    for csvrow in tqdm.tqdm(spamreader, desc=filename, total=total):
-                        yield csvheader, csvrow
+    for filepath in iolib.find_csv_files(folderpath, prefix=prefix):
+        yield from iolib.read_csv(filepath, encoding=encoding, header=header)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+from array import array
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+
+VERSION = 3
+
+# kinds of column: typed arrays for numbers, flags and small codes, dictionary-encoded int32 codes for the rest
+typecodes = {"float": "d", "bool": "b", "code": "b", "str": "i", "datetime": "i"}
+
+
+class ColumnWriter:
+    def __init__(self, kinds: Dict[str, str]) -> None:
+        self.kinds = kinds
+        self.columns = {name: array(typecodes[kind]) for (name, kind) in kinds.items()}
+        self.dictionaries = {name: {} for (name, kind) in kinds.items() if kind in ("str", "datetime")}
+
+    def append(self, values: Dict[str, object]) -> None:
+        for name, kind in self.kinds.items():
+            value = values[name]
+            if kind == "float":
+                self.columns[name].append(value if value is not None else float("nan"))
+            elif kind == "bool":
+                self.columns[name].append(1 if value else 0)
+            elif kind == "code":
+                self.columns[name].append(value)
+            else:
+                dictionary = self.dictionaries[name]
+                code = dictionary.get(value)
+                if code is None:
+                    code = dictionary[value] = len(dictionary)
+                self.columns[name].append(code)
+
+    def save(self, folderpath: str) -> None:
+        # written aside and renamed, so a half-written cache is never picked up
+        staging = folderpath + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name, column in self.columns.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.frombuffer(column, dtype=np.dtype(column.typecode)))
+        dictionaries = {name: [_encode(v) for v in d] for (name, d) in self.dictionaries.items()}
+        with open(os.path.join(staging, "dictionaries.json"), "w", encoding="utf-8") as fh:
+            json.dump({"version": VERSION, "kinds": self.kinds, "dictionaries": dictionaries}, fh)
+        shutil.rmtree(folderpath, ignore_errors=True)
+        os.replace(staging, folderpath)
+
+
+def exists(folderpath: str) -> bool:
+    return os.path.isfile(os.path.join(folderpath, "dictionaries.json"))
+
+
+def load(folderpath: str) -> Dict[str, List[object]]:
+    # memory-mapped arrays, decoded back to python values column by column
+    with open(os.path.join(folderpath, "dictionaries.json"), "r", encoding="utf-8") as fh:
+        meta = json.load(fh)
+    columns = {}
+    for name, kind in meta["kinds"].items():
+        data = np.load(os.path.join(folderpath, f"{name}.npy"), mmap_mode="r")
+        if kind == "float":
+            columns[name] = [None if v != v else v for v in data.tolist()]
+        elif kind == "bool":
+            columns[name] = data.astype(bool).tolist()
+        elif kind == "code":
+            columns[name] = data.tolist()
+        else:
+            values = np.empty(len(meta["dictionaries"][name]), dtype=object)
+            values[:] = [_decode(v, kind) for v in meta["dictionaries"][name]]
+            columns[name] = values[data].tolist()
+    return columns
+
+
+def path_for(folderpath: str, fingerprint: str, part: str) -> str:
+    return os.path.join(folderpath, f"v{VERSION}", fingerprint, part)
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _decode(value, kind: str):
+    return datetime.fromisoformat(value) if kind == "datetime" and value is not None else value
@@ -0,0 +1,67 @@
+import re
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+CACHE_SIZE = 65_536
+
+
+def _ymd(match) -> datetime:
+    return datetime(int(match["y"]), int(match["m"]), int(match["d"]), int(match["H"] or 0), int(match["M"] or 0))
+
+
+formats: List[Tuple[str, "re.Pattern"]] = [
+    # YYYY-MM-DD HH:MM (price paid data)
+    ("iso", re.compile(r"(?P<y>\d{4})-(?P<m>\d{2})-(?P<d>\d{2})(?:[ T](?P<H>\d{2}):(?P<M>\d{2})(?::\d{2})?)?")),
+    # DD/MM/YYYY (ofsted)
+    ("uk", re.compile(r"(?P<d>\d{1,2})/(?P<m>\d{1,2})/(?P<y>\d{4})(?: (?P<H>\d{2}):(?P<M>\d{2})(?::\d{2})?)?")),
+    ("uk-dashed", re.compile(r"(?P<d>\d{1,2})-(?P<m>\d{1,2})-(?P<y>\d{4})(?: (?P<H>\d{2}):(?P<M>\d{2})(?::\d{2})?)?")),
+]
+
+
+class DateParser:
+    def __init__(self, fallback: Optional[Callable[[str], Optional[datetime]]] = None) -> None:
+        self.fallback = fallback or _dateparser_parse
+        self.format = None
+        self.cache: Dict[str, Optional[datetime]] = {}
+
+    def parse(self, raw: str) -> Optional[datetime]:
+        try:
+            return self.cache[raw]
+        except KeyError:
+            pass
+        if len(self.cache) >= CACHE_SIZE:
+            self.cache.clear()
+        parsed = self._parse(raw.strip()) if raw else None
+        self.cache[raw] = parsed
+        return parsed
+
+    def _parse(self, raw: str) -> Optional[datetime]:
+        # detected format first, then detect again (a new file may use another one)
+        if self.format:
+            parsed = self._strict(self.format[1], raw)
+            if parsed:
+                return parsed
+        for fmt in formats:
+            if fmt is not self.format:
+                parsed = self._strict(fmt[1], raw)
+                if parsed:
+                    self.format = fmt
+                    return parsed
+        return self.fallback(raw)
+
+    @staticmethod
+    def _strict(pattern: "re.Pattern", raw: str) -> Optional[datetime]:
+        match = pattern.fullmatch(raw)
+        if match:
+            try:
+                return _ymd(match)
+            except ValueError:
+                return None
+        return None
+
+
+def _dateparser_parse(raw: str) -> Optional[datetime]:
+    # imported lazily: dateparser is slow to import and rarely needed
+    import dateparser
+
+    return dateparser.parse(raw)
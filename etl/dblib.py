@@ -1,22 +1,46 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
 from abc import ABC
-from dataclasses import dataclass
-from typing import Set, List, Dict, Any, Generator, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, dataclass, field, fields
+from typing import Set, List, Dict, Any, Generator, Iterable, Optional, Tuple, Callable
 from datetime import datetime
 from tqdm import tqdm
 
 import mysql.connector as mysql
+from mysql.connector import errorcode
+
+import idmaplib
+import iolib
+import metricslib
+import pddlib
+import postcodelib
+import searchlib
+import storagelib
 
 BATCH_SIZE = 250
+LOOKUP_SIZE = 1000
+SNAPSHOT_SAMPLE = 64
+FETCH_SIZE = 10_000
+STAGING_PREFIX = "staging_property_transactions_"
+LOCAL_INFILE_REFUSED = {
+    errorcode.ER_NOT_ALLOWED_COMMAND,
+    errorcode.CR_LOAD_DATA_LOCAL_INFILE_REJECTED,
+    errorcode.ER_CLIENT_LOCAL_FILES_DISABLED,
+}
 
 
 @dataclass(frozen=True)
 class Postcode:
-    county_id: int
-    municipality_id: int
-    district_id: int
-    locality_id: int
+    # a row of `postcodes`, with the ids of every level above it
+    area_id: int
     postgroup_id: int
-    postcode_id: int
+    sector_id: int
     name: str
 
 
@@ -24,7 +48,9 @@ class Postcode:
 class Repositories:
     conn: mysql.MySQLConnection
     localities: "LocalityRepository"
+    postcode_areas: "PostcodeAreaRepository"
     postgroups: "PostgroupRepository"
+    postcode_sectors: "PostcodeSectorRepository"
     postcodes: "PostcodeRepository"
     localities_postgroups: "LocalityPostcodeRepository"
     property_types: "PropertyTypeRepository"
@@ -34,227 +60,713 @@ class Repositories:
     education_phases: "EducationPhaseRepository"
     schools: "SchoolRepository"
     ratings: "RatingRepository"
+    aggregates: "AggregateRepository"
+    manifest: "ManifestRepository"
+    generations: "GenerationRepository"
+    pool: "ConnectionPool" = None
+    backend: storagelib.Backend = None
+    # the connection is not thread-safe: concurrent stages hold this while using it
+    lock: threading.RLock = field(default_factory=threading.RLock)
 
     def commit(self):
-        self.conn.commit()
+        with metricslib.metrics.stage("commit"):
+            if self.pool:
+                self.pool.commit()
+            else:
+                self.conn.commit()
+
+    def build_indexes(self):
+        # the indexes a backend defers until the rows are loaded
+        if self.backend:
+            self.backend.build_indexes(self.conn)
+
+    def finish(self):
+        if self.backend:
+            self.backend.finish(self.conn)
+
+    def save_caches(self):
+        for cache in self.caches():
+            cache.save(self.conn)
+
+    def caches(self) -> List["DimensionCache"]:
+        repositories = [getattr(self, f.name) for f in fields(self)]
+        return [r.cache for r in repositories if isinstance(r, DimensionRepository)]
+
+    def concurrently(self, *calls: Tuple[Callable, tuple]) -> List[Any]:
+        # independent repository calls, in parallel when their repositories are on different connections;
+        # committed afterwards, so repositories on other connections can reference the rows (foreign keys)
+        if not self.pool or len(self.pool) == 1:
+            return [fn(*args) for (fn, args) in calls]
+        results = self.pool.run([(fn.__self__.conn, functools.partial(fn, *args)) for (fn, args) in calls])
+        self.pool.commit()
+        return results
+
+
+class BulkLoader:
+    def __init__(self, conn: mysql.MySQLConnection, local_infile: bool = False) -> None:
+        self.conn = conn
+        self.local_infile = local_infile
+        self.max_allowed_packet = None
+        self.latency = None
+        self.batch_sizes: Dict[str, int] = {}
+        self.max_rows: Dict[str, int] = {}
+        # tables that failed to LOAD DATA, inserted in batches from then on
+        self.batched: Set[str] = set()
+
+    def probe(self) -> None:
+        # server limits and round-trip latency, measured once per connection
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT @@max_allowed_packet, @@local_infile")
+            max_allowed_packet, local_infile = cursor.fetchone()
+            self.max_allowed_packet = int(max_allowed_packet or 0) or 4 * 1024 * 1024
+            self.local_infile = self.local_infile and bool(int(local_infile or 0))
+            started = time.perf_counter()
+            for _ in range(3):
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            self.latency = (time.perf_counter() - started) / 3
+
+    def insert(self, cursor, table: str, columns: List[str], records: List[Any], batches) -> None:
+        if self.latency is None:
+            self.probe()
+        if self.local_infile and table not in self.batched:
+            try:
+                started = time.perf_counter()
+                self._load_data(cursor, table, columns, records)
+                metricslib.metrics.observe(f"insert({table})", time.perf_counter() - started)
+                return
+            except mysql.Error as e:
+                # only a refused LOCAL INFILE falls back, anything else (deadlocks, lock waits) is the caller's
+                if e.errno not in LOCAL_INFILE_REFUSED:
+                    raise
+                print((f"LOAD DATA LOCAL INFILE refused for {table}, falling back to batched inserts", e))
+                self.batched.add(table)
+        sql = f"INSERT IGNORE INTO `{table}` ({', '.join(columns)}) VALUES "
+        row_sql = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        for batch in batches(lambda: self.batch_size_for(table, records)):
+            started = time.perf_counter()
+            cursor.execute(sql + ", ".join([row_sql] * len(batch)), [v for r in batch for v in r])
+            elapsed = time.perf_counter() - started
+            metricslib.metrics.observe(f"insert({table})", elapsed)
+            self._adapt(table, len(batch), elapsed)
+
+    def batch_size_for(self, table: str, records: List[Any]) -> int:
+        if table not in self.batch_sizes:
+            self.max_rows[table] = self._max_rows(records)
+            self.batch_sizes[table] = min(BATCH_SIZE, self.max_rows[table])
+        return self.batch_sizes[table]
+
+    def _max_rows(self, records: List[Any]) -> int:
+        # statements must fit in max_allowed_packet, with headroom for escaping
+        row_bytes = max(sum(len(str(v)) + 4 for v in r) for r in records[:100])
+        return max(1, (self.max_allowed_packet // 2) // row_bytes)
+
+    def _adapt(self, table: str, rows: int, elapsed: float) -> None:
+        # aim for statements long enough that the round trip is ~5% of their time
+        if rows >= self.batch_sizes[table]:
+            target = min(max(20 * self.latency, 0.05), 1.0)
+            factor = min(max(target / elapsed, 0.5), 2.0) if elapsed > 0 else 2.0
+            self.batch_sizes[table] = max(1, min(int(rows * factor), self.max_rows[table]))
+
+    def _load_data(self, cursor, table: str, columns: List[str], records: List[Any]) -> None:
+        # rows go to a TSV file, LOAD DATA into a staging table, then INSERT IGNORE ... SELECT into the target;
+        # the staging table only copies the columns (a temporary table cannot be partitioned like the target)
+        staging = f"staging_{table}"
+        fh = tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8", newline="\n", delete=False)
+        try:
+            with fh:
+                for record in records:
+                    fh.write("\t".join(_tsv(v) for v in record))
+                    fh.write("\n")
+            metricslib.metrics.get(f"insert({table})").add(bytes=os.path.getsize(fh.name))
+            cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{staging}`")
+            cursor.execute(f"CREATE TEMPORARY TABLE `{staging}` AS SELECT {', '.join(columns)} FROM `{table}` LIMIT 0")
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE `{staging}` CHARACTER SET utf8mb4 ({', '.join(columns)})",
+                (fh.name,),
+            )
+            cursor.execute(
+                f"INSERT IGNORE INTO `{table}` ({', '.join(columns)}) SELECT {', '.join(columns)} FROM `{staging}`"
+            )
+            cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{staging}`")
+        finally:
+            os.remove(fh.name)
+
+
+class ConnectionPool:
+    # the first connection coordinates (lookups, checkpoints), all of them take a share of the large inserts
+    def __init__(self, connections: List[mysql.MySQLConnection], local_infile: bool = False) -> None:
+        self.connections = connections
+        self.loaders = [BulkLoader(conn, local_infile) for conn in connections]
+        self.executor = ThreadPoolExecutor(len(connections), "dblib-pool") if len(connections) > 1 else None
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def run(self, tasks: List[Tuple[mysql.MySQLConnection, Callable[[], Any]]]) -> List[Any]:
+        # tasks on the same connection run one after the other, tasks on different connections concurrently
+        if self.executor is None:
+            return [fn() for (_, fn) in tasks]
+        groups: Dict[int, List[Tuple[int, Callable[[], Any]]]] = {}
+        for i, (conn, fn) in enumerate(tasks):
+            groups.setdefault(id(conn), []).append((i, fn))
+        futures = [self.executor.submit(lambda group: [(i, fn()) for (i, fn) in group], g) for g in groups.values()]
+        # every task is waited for, so no connection is still in use when the caller rolls back
+        results, errors = [None] * len(tasks), []
+        for future in futures:
+            try:
+                for i, result in future.result():
+                    results[i] = result
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        return results
+
+    def loader_for(self, conn: mysql.MySQLConnection) -> BulkLoader:
+        return self.loaders[self.connections.index(conn)]
+
+    def commit(self) -> None:
+        # the coordinator last, so its checkpoint is never ahead of the rows on the other connections
+        for conn in self.connections[1:] + self.connections[:1]:
+            conn.commit()
+
+    def rollback(self) -> None:
+        for conn in self.connections:
+            conn.rollback()
+
+    def close(self) -> None:
+        if self.executor:
+            self.executor.shutdown()
+        for conn in self.connections:
+            conn.close()
+
+
+def _tsv(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _stream(cursor) -> Generator[tuple, None, None]:
+    rows = cursor.fetchmany(FETCH_SIZE)
+    while rows:
+        yield from rows
+        rows = cursor.fetchmany(FETCH_SIZE)
 
 
 class BaseRepository(ABC):
-    def __init__(self, conn: mysql.MySQLConnection) -> None:
+    def __init__(self, conn: mysql.MySQLConnection, loader: BulkLoader = None, pool: ConnectionPool = None) -> None:
         self.conn = conn
+        self.loader = loader or BulkLoader(conn)
+        self.pool = pool
 
-    def _batch_page(self, records: List[Any], desc: str) -> Generator[List[Any], None, None]:
+    def _insert(
+        self,
+        cursor,
+        table: str,
+        columns: List[str],
+        records: List[Any],
+        desc: str,
+        loader: BulkLoader = None,
+    ) -> None:
+        records = [r for r in records if r]
+        if records:
+            with metricslib.metrics.stage(f"insert({table})") as stage:
+                stage.add(rows=len(records))
+                batches = lambda size: self._batch_page(records, desc, size)
+                (loader or self.loader).insert(cursor, table, columns, records, batches)
+
+    def _insert_sharded(
+        self, table: str, columns: List[str], records: List[Any], desc: str, key: Callable[[Any], Any]
+    ) -> None:
+        # large inserts split by key hash over the pooled connections, then committed together or rolled back
+        records = [r for r in records if r]
+        if not self.pool or len(self.pool) == 1 or not records:
+            with self.conn.cursor() as cursor:
+                return self._insert(cursor, table, columns, records, desc)
+        shards = [[] for _ in self.pool.connections]
+        for record in records:
+            shards[hash(key(record)) % len(shards)].append(record)
+        # rows pending on any connection (the ones referenced here) become visible to the others
+        self.pool.commit()
+        tasks = []
+        for conn, shard in zip(self.pool.connections, shards):
+            tasks.append((conn, functools.partial(self._insert_shard, conn, table, columns, shard, desc)))
+        try:
+            self.pool.run(tasks)
+        except Exception:
+            self.pool.rollback()
+            raise
+        self.pool.commit()
+
+    def _insert_shard(self, conn, table: str, columns: List[str], records: List[Any], desc: str) -> None:
+        with conn.cursor() as cursor:
+            self._insert(cursor, table, columns, records, desc, self.pool.loader_for(conn))
+
+    def _batch_page(
+        self, records: List[Any], desc: str, batch_size: Callable[[], int] = lambda: BATCH_SIZE
+    ) -> Generator[List[Any], None, None]:
         if records:
             batch = []
-            for record in tqdm(records, desc=desc):
+            for record in tqdm(records, desc=desc, leave=False):
                 if record:
                     batch.append(record)
-                    if len(batch) >= BATCH_SIZE:
+                    if len(batch) >= batch_size():
                         yield batch
                         batch.clear()
             if len(batch) > 0:
                 yield batch
 
 
-class LocalityRepository(BaseRepository):
-    def ensure_ids_for(self, locality_names: Set[str]) -> Dict[str, int]:
-        locality_names = set([pn for pn in locality_names if pn])
-        if not locality_names:
-            return {}
-        else:
-            with self.conn.cursor() as cursor:
-                # collecting
-                cursor.execute("SELECT name FROM localities")
-                incoming_records = set((pn,) for pn in locality_names)
-                existing_records = set(cursor)
-                missing_records = sorted(incoming_records - existing_records)
-                # inserting missing
-                for batch in self._batch_page(missing_records, "inserting(localities)"):
-                    sql = "INSERT INTO localities (name) VALUES (%s)"
-                    cursor.executemany(sql, batch)
-                # mapping
-                cursor.execute("SELECT id, name FROM localities")
-                return {ln: lid for (lid, ln) in cursor}
-
-
-class PostgroupRepository(BaseRepository):
-    def ensure_ids_for(self, postgroups: Set[str]) -> Dict[str, int]:
-        postgroups = set([pg for pg in postgroups if pg])
-        if not postgroups:
-            return {}
-        else:
-            with self.conn.cursor() as cursor:
-                # collecting
-                cursor.execute("SELECT name FROM postgroups")
-                incoming_records = set((pg,) for pg in postgroups)
-                existing_records = set(cursor)
-                missing_records = sorted(incoming_records - existing_records)
-                for batch in self._batch_page(missing_records, "inserting(postgroups)"):
-                    sql = "INSERT INTO postgroups (name) VALUES (%s)"
-                    cursor.executemany(sql, batch)
-                # mapping
-                cursor.execute("SELECT id, name FROM postgroups")
-                return {postgroup: pg_id for (pg_id, postgroup) in cursor}
-
-
-class PostcodeRepository(BaseRepository):
-    def ensure_ids_for(self, postcodes: Set[str], pgids: Dict[str, int]) -> Dict[str, int]:
-        postcodes = set(pc for pc in postcodes if pc)
-        records = set((pgids.get(pc.split(" ")[0], None), pc) for pc in postcodes if pc)
-        if not postcodes:
+class DimensionCache:
+    def __init__(self, table: str, folderpath: str = None) -> None:
+        self.table = table
+        self.filepath = os.path.join(folderpath, f"{table}.json") if folderpath else None
+        self.ids: Dict[str, int] = {}
+        self.loaded = False
+
+    def load(self, cursor) -> None:
+        # the snapshot is only trusted while the table still has the same size and highest id
+        self.loaded = True
+        if self.filepath and os.path.isfile(self.filepath):
+            with open(self.filepath, "r", encoding="utf-8") as fh:
+                snapshot = json.load(fh)
+            if snapshot.get("stamp") == self._stamp(cursor) and self._sampled(cursor, snapshot["ids"]):
+                self.ids.update(snapshot["ids"])
+
+    def save(self, conn: mysql.MySQLConnection) -> None:
+        if self.filepath and self.ids:
+            with conn.cursor() as cursor:
+                stamp = self._stamp(cursor)
+            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            with open(self.filepath + ".tmp", "w", encoding="utf-8") as fh:
+                json.dump({"stamp": stamp, "ids": self.ids}, fh)
+            os.replace(self.filepath + ".tmp", self.filepath)
+
+    def _stamp(self, cursor) -> List[int]:
+        cursor.execute(f"SELECT COUNT(*), MAX(id) FROM `{self.table}`")
+        return [int(v or 0) for v in cursor.fetchone()]
+
+    def _sampled(self, cursor, ids: Dict[str, int]) -> bool:
+        # a table rebuilt to the same size can still number its names differently
+        names = sorted(ids)[:: max(1, len(ids) // SNAPSHOT_SAMPLE)][:SNAPSHOT_SAMPLE]
+        if not names:
+            return True
+        cursor.execute(f"SELECT id, name FROM `{self.table}` WHERE name IN ({', '.join(['%s'] * len(names))})", names)
+        return {name: id for (id, name) in cursor} == {n: ids[n] for n in names}
+
+
+class DimensionRepository(BaseRepository):
+    table: str = None
+    columns: List[str] = ["name"]
+
+    def __init__(self, conn: mysql.MySQLConnection, loader: BulkLoader = None, cache_folder: str = None) -> None:
+        super().__init__(conn, loader)
+        self.cache = DimensionCache(self.table, cache_folder)
+
+    def get_ids_for(self, names: Set[str]) -> Dict[str, int]:
+        names = set(n for n in names if n)
+        with self.conn.cursor() as cursor:
+            self._fetch_ids(cursor, names)
+        return {n: self.cache.ids[n] for n in names if n in self.cache.ids}
+
+    def _ensure_ids(self, records: Dict[str, tuple], desc: str) -> Dict[str, int]:
+        # records are keyed by name, valued by the row to insert if the name is missing
+        if not records:
             return {}
-        else:
-            with self.conn.cursor() as cursor:
-                # collecting
-                cursor.execute("SELECT postgroup_id, name FROM postcodes")
-                incoming_records = set(r for r in records if r[0])
-                existing_records = set(cursor)
-                missing_records = sorted(incoming_records - existing_records)
-                for batch in self._batch_page(missing_records, "inserting(postcodes)"):
-                    sql = "INSERT INTO postcodes (postgroup_id, name) VALUES (%s, %s)"
-                    cursor.executemany(sql, batch)
-            return self.get_ids()
-
-    def get_ids(self) -> Dict[str, int]:
-        # mapping
         with self.conn.cursor() as cursor:
-            cursor.execute("SELECT id, name FROM postcodes")
-            return {postcode: pc_id for (pc_id, postcode) in cursor}
+            # collecting (only the incoming names)
+            self._fetch_ids(cursor, records.keys())
+            missing_records = sorted(r for (n, r) in records.items() if n not in self.cache.ids)
+            # inserting missing
+            self._insert(cursor, self.table, self.columns, missing_records, desc)
+            # mapping (only the rows just inserted)
+            self._fetch_ids(cursor, [r[-1] for r in missing_records])
+        return {n: self.cache.ids[n] for n in records if n in self.cache.ids}
+
+    def _fetch_ids(self, cursor, names) -> None:
+        if not self.cache.loaded:
+            self.cache.load(cursor)
+        names = sorted(n for n in names if n not in self.cache.ids)
+        if not names:
+            return
+        with metricslib.metrics.stage(f"lookup({self.table})") as stage:
+            stage.add(rows=len(names))
+            for i in range(0, len(names), LOOKUP_SIZE):
+                page = names[i : i + LOOKUP_SIZE]
+                started = time.perf_counter()
+                cursor.execute(
+                    f"SELECT id, name FROM `{self.table}` WHERE name IN ({', '.join(['%s'] * len(page))})",
+                    page,
+                )
+                self.cache.ids.update((name, id) for (id, name) in cursor)
+                metricslib.metrics.observe(f"lookup({self.table})", time.perf_counter() - started)
+
+
+class LocalityRepository(DimensionRepository):
+    table = "localities"
+    columns = ["search_key", "name"]
+
+    def ensure_ids_for(self, locality_names: Set[str]) -> Dict[str, int]:
+        records = {ln: (searchlib.search_key(ln), ln) for ln in locality_names if ln}
+        with self.conn.cursor() as cursor:
+            self._fetch_ids(cursor, records.keys())
+        missing_names = [ln for ln in records if ln not in self.cache.ids]
+        lids = self._ensure_ids(records, "inserting(localities)")
+        # prefixes of the search keys, for the localities just inserted
+        prefixes = set()
+        for ln in missing_names:
+            prefixes.update((prefix, lids[ln]) for prefix in searchlib.prefixes_for(records[ln][0]) if ln in lids)
+        with self.conn.cursor() as cursor:
+            columns = ["prefix", "locality_id"]
+            self._insert(cursor, "locality_prefixes", columns, sorted(prefixes), "inserting(locality_prefixes)")
+        return lids
+
+
+class PostcodeAreaRepository(DimensionRepository):
+    table = "postcode_areas"
+
+    def ensure_ids_for(self, levels: Iterable[postcodelib.PostcodeLevels]) -> Dict[str, int]:
+        records = {l.area: (l.area,) for l in levels}
+        return self._ensure_ids(records, "inserting(postcode_areas)")
+
+
+class PostgroupRepository(DimensionRepository):
+    # postgroups are the postcode districts (outward codes)
+    table = "postgroups"
+    columns = ["area_id", "name"]
+
+    def ensure_ids_for(self, levels: Iterable[postcodelib.PostcodeLevels], areaids: Dict[str, int]) -> Dict[str, int]:
+        records = {l.district: (areaids.get(l.area, None), l.district) for l in levels}
+        records = {pg: r for (pg, r) in records.items() if r[0]}
+        return self._ensure_ids(records, "inserting(postgroups)")
+
+
+class PostcodeSectorRepository(DimensionRepository):
+    table = "postcode_sectors"
+    columns = ["postgroup_id", "name"]
+
+    def ensure_ids_for(self, levels: Iterable[postcodelib.PostcodeLevels], pgids: Dict[str, int]) -> Dict[str, int]:
+        records = {l.sector: (pgids.get(l.district, None), l.sector) for l in levels}
+        records = {ps: r for (ps, r) in records.items() if r[0]}
+        return self._ensure_ids(records, "inserting(postcode_sectors)")
+
+
+class PostcodeRepository(DimensionRepository):
+    table = "postcodes"
+    columns = ["area_id", "postgroup_id", "sector_id", "name"]
+
+    def ensure_ids_for(
+        self,
+        levels: Dict[str, postcodelib.PostcodeLevels],
+        areaids: Dict[str, int],
+        pgids: Dict[str, int],
+        sectorids: Dict[str, int],
+    ) -> Dict[str, int]:
+        postcodes = (
+            Postcode(areaids.get(l.area, None), pgids.get(l.district, None), sectorids.get(l.sector, None), pc)
+            for (pc, l) in levels.items()
+        )
+        records = {p.name: astuple(p) for p in postcodes if p.area_id and p.postgroup_id and p.sector_id}
+        return self._ensure_ids(records, "inserting(postcodes)")
 
 
 class LocalityPostcodeRepository(BaseRepository):
     def link(self, locality_postcode: Set[Tuple[str, str]], lids: Dict[str, int], pcids: Dict[str, int]) -> None:
         translated_links = set((lids.get(l, None), pcids.get(pc, None)) for (l, pc) in locality_postcode)
         with self.conn.cursor() as cursor:
-            # collecting
-            cursor.execute("SELECT locality_id, postcode_id FROM localities_postcodes")
-            inbound_links = set(l for l in translated_links if l[0] and l[1])
-            exiting_links = set(cursor)
-            missing_links = sorted(inbound_links - exiting_links)
-            for batch in self._batch_page(missing_links, "linking(locality|postcode)"):
-                sql = "INSERT INTO localities_postcodes (locality_id, postcode_id) VALUES (%s, %s)"
-                cursor.executemany(sql, batch)
+            # inserting missing (the primary key ignores existing links)
+            inbound_links = sorted(l for l in translated_links if l[0] and l[1])
+            columns = ["locality_id", "postcode_id"]
+            self._insert(cursor, "localities_postcodes", columns, inbound_links, "linking(locality|postcode)")
+
 
+class PropertyTypeRepository(DimensionRepository):
+    table = "property_types"
 
-class PropertyTypeRepository(BaseRepository):
     def ensure_ids_for(self, property_type_names: Set[str]) -> Dict[str, int]:
-        property_type_names = set([ptn for ptn in property_type_names if ptn])
-        if not property_type_names:
-            return {}
-        else:
-            with self.conn.cursor() as cursor:
-                # collecting
-                cursor.execute("SELECT name FROM property_types")
-                inbound_records = set((pt,) for pt in property_type_names)
-                existing_records = set(cursor)
-                missing_records = sorted(inbound_records - existing_records)
-                for batch in self._batch_page(missing_records, "inserting(property_types)"):
-                    sql = "INSERT INTO property_types (name) VALUES (%s)"
-                    cursor.executemany(sql, batch)
-                # mapping
-                cursor.execute("SELECT id, name FROM property_types")
-                return {pt_name: pt_id for (pt_id, pt_name) in cursor}
-        return {}
-
-
-class TenureRepository(BaseRepository):
+        records = {ptn: (ptn,) for ptn in property_type_names if ptn}
+        return self._ensure_ids(records, "inserting(property_types)")
+
+
+class TenureRepository(DimensionRepository):
+    table = "tenures"
+
     def ensure_ids_for(self, place_names: Set[str]) -> Dict[str, int]:
-        place_names = set([pn for pn in place_names if pn])
-        if not place_names:
-            return {}
-        else:
-            with self.conn.cursor() as cursor:
-                # collecting
-                cursor.execute("SELECT name FROM tenures")
-                inbound_records = set((pn,) for pn in place_names)
-                existing_records = set(cursor)
-                missing_records = sorted(inbound_records - existing_records)
-                for batch in self._batch_page(missing_records, "inserting(tenures)"):
-                    sql = "INSERT INTO tenures (name) VALUES (%s)"
-                    cursor.executemany(sql, batch)
-                # mapping
-                cursor.execute("SELECT id, name FROM tenures")
-                return {t_name: t_id for (t_id, t_name) in cursor}
-
-
-class EducationPhaseRepository(BaseRepository):
+        records = {pn: (pn,) for pn in place_names if pn}
+        return self._ensure_ids(records, "inserting(tenures)")
+
+
+class EducationPhaseRepository(DimensionRepository):
+    table = "education_phases"
+
     def ensure_ids_for(self, education_phases: Set[str]) -> Dict[str, int]:
-        education_phases = set([ep for ep in education_phases if ep])
-        if not education_phases:
-            return {}
-        else:
-            with self.conn.cursor() as cursor:
-                # collecting
-                cursor.execute("SELECT name FROM education_phases")
-                inbound_records = set((ep,) for ep in education_phases)
-                existing_records = set(cursor)
-                missing_records = sorted(inbound_records - existing_records)
-                for batch in self._batch_page(missing_records, "inserting(ep)"):
-                    sql = "INSERT INTO education_phases (name) VALUES (%s)"
-                    cursor.executemany(sql, batch)
-                # mapping
-                cursor.execute("SELECT id, name FROM education_phases")
-                return {ep_name: ep_id for (ep_id, ep_name) in cursor}
+        records = {ep: (ep,) for ep in education_phases if ep}
+        return self._ensure_ids(records, "inserting(ep)")
+
+
+class PropertyIds:
+    # property ids by (postcode, property_type, number_or_name, building_ref, street_name), over the compact map
+    def __init__(self, idmap: idmaplib.CompactIdMap, pcids: Dict[str, int], ptids: Dict[int, int]) -> None:
+        self.idmap = idmap
+        self.pcids = pcids
+        self.ptids = ptids
+
+    def get(self, p: Tuple[str, int, str, str, str], default: int = None) -> int:
+        pc, pt, non, br, sn = p
+        key = (self.pcids.get(pc, None), self.ptids.get(pt, None), non, br, sn)
+        return self.idmap.get(key, default) if key[0] and key[1] else default
 
 
 class PropertyRepository(BaseRepository):
+    def __init__(self, conn: mysql.MySQLConnection, loader: BulkLoader = None, pool: ConnectionPool = None) -> None:
+        super().__init__(conn, loader, pool)
+        self.idmap: idmaplib.CompactIdMap = None
+
     def ensure_ids_for(
         self,
-        properties: Set[Tuple[str, str, str, str, str]],
+        properties: Set[Tuple[str, int, str, str, str]],
         pcids: Dict[str, int],
-        ptids: Dict[str, int],
-    ) -> Dict[Tuple[str, str, str, str, str], int]:
+        ptids: Dict[int, int],
+    ) -> PropertyIds:
         records = set((pcids.get(pc, None), ptids.get(pt, None), non, br, sn) for (pc, pt, non, br, sn) in properties)
         with self.conn.cursor() as cursor:
+            # mapping (the whole table once, streamed into the compact map)
+            if self.idmap is None:
+                with metricslib.metrics.stage("load(properties)") as stage:
+                    cursor.execute(
+                        """
+                        SELECT id, postcode_id, property_type_id, number_or_name, building_ref, street_name
+                        FROM properties
+                        """
+                    )
+                    self.idmap = idmaplib.CompactIdMap(self._resolve).build((r[1:], r[0]) for r in _stream(cursor))
+                    stage.add(rows=len(self.idmap))
             # inserting missing
-            sql = """
-            INSERT IGNORE INTO properties
-            (postcode_id, property_type_id, number_or_name, building_ref, street_name)
-            VALUES
-            (%s, %s, %s, %s, %s)
-            """
+            columns = ["postcode_id", "property_type_id", "number_or_name", "building_ref", "street_name"]
             inbound_records = [r for r in records if r[0] and r[1]]
-            for batch in self._batch_page(inbound_records, "inserting(properties)"):
-                cursor.executemany(sql, batch)
-            # mapping
+            missing_records = [r for r in inbound_records if self.idmap.get(r) is None]
+            self._insert_sharded("properties", columns, missing_records, "inserting(properties)", lambda r: r[0])
+            # mapping (only the rows just inserted)
+            missing_keys = set(missing_records)
+            postcode_ids = sorted(set(r[0] for r in missing_records))
+            with metricslib.metrics.stage("lookup(properties)") as stage:
+                stage.add(rows=len(missing_records))
+                for i in range(0, len(postcode_ids), LOOKUP_SIZE):
+                    page = postcode_ids[i : i + LOOKUP_SIZE]
+                    started = time.perf_counter()
+                    cursor.execute(
+                        f"""
+                        SELECT id, postcode_id, property_type_id, number_or_name, building_ref, street_name
+                        FROM properties
+                        WHERE postcode_id IN ({', '.join(['%s'] * len(page))})
+                        """,
+                        page,
+                    )
+                    for row in _stream(cursor):
+                        if row[1:] in missing_keys:
+                            self.idmap.add(row[1:], row[0])
+                    metricslib.metrics.observe("lookup(properties)", time.perf_counter() - started)
+        return PropertyIds(self.idmap, pcids, ptids)
+
+    def _resolve(self, key: Tuple[int, int, str, str, str]) -> int:
+        # exact lookup, for the rare keys whose hashes collide
+        with self.conn.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT p.id, pc.name `postcode`, pt.name `property_type`,
-                    number_or_name, building_ref, street_name
-                FROM properties p
-                    INNER JOIN postcodes pc ON p.postcode_id = pc.id
-                    INNER JOIN property_types pt ON p.property_type_id = pt.id
-                """
+                SELECT id FROM properties
+                WHERE postcode_id = %s AND property_type_id = %s
+                    AND number_or_name = %s AND building_ref = %s AND street_name = %s
+                """,
+                key,
             )
-            return {
-                (postcode, property_type, number_or_name, building_ref, street_name): pid
-                for (pid, postcode, property_type, number_or_name, building_ref, street_name) in cursor
-            }
+            found = cursor.fetchall()
+            return found[0][0] if found else None
 
 
 class TransactionRepository(BaseRepository):
-    def ensure(
+    columns = ["property_id", "tenure_id", "new_build", "price", "ts", "guid"]
+
+    def __init__(
+        self,
+        conn: mysql.MySQLConnection,
+        loader: BulkLoader = None,
+        pool: ConnectionPool = None,
+        partitions: Dict[int, str] = None,
+        leftovers: List[str] = (),
+        staging: bool = False,
+    ) -> None:
+        super().__init__(conn, loader, pool)
+        # partitions by year; when staging, years loaded anew are staged and swapped in a partition at a time
+        self.partitions = partitions or {}
+        self.leftovers = list(leftovers)
+        self.staging = staging and bool(self.partitions)
+        self.staged: Dict[int, str] = None
+        self.unstaged: Set[int] = set()
+
+    def records_for(
         self,
-        transactions: Set[Tuple[Tuple[str, str, str, str, str], str, bool, float, datetime]],
-        pids: Dict[Tuple[str, str, str, str, str], int],
-        tids: Dict[str, int],
-    ):
+        transactions: Iterable[Tuple[Tuple[str, int, str, str, str], int, bool, float, datetime, str, str]],
+        pids: PropertyIds,
+        tids: Dict[int, int],
+    ) -> List[Tuple[int, int, bool, float, datetime, str]]:
+        # deleted transactions are never added
         records = set(
-            (pids.get(p, None), tids.get(t, None), new_build, price, ts)
-            for (p, t, new_build, price, ts) in transactions
-            if price and ts
+            (pids.get(p, None), tids.get(t, None), new_build, price, ts, guid)
+            for (p, t, new_build, price, ts, guid, status) in transactions
+            if price and ts and status != pddlib.DELETED
         )
+        return [r for r in records if r[0] and r[1]]
+
+    def deletes_for(
+        self, transactions: Iterable[Tuple[Tuple[str, int, str, str, str], int, bool, float, datetime, str, str]]
+    ) -> List[str]:
+        # changes are deleted and inserted again (the GUID is unique together with ts, which a change may move)
+        changes = (pddlib.CHANGED, pddlib.DELETED)
+        return sorted(guid for (*_, guid, status) in transactions if guid and status in changes)
+
+    def insert(self, records: List[Tuple[int, int, bool, float, datetime, str]], deletes: List[str] = ()):
+        # deletes (by GUID) and inserts in one transaction on the coordinator, committed with the checkpoint:
+        # sharding commits the pending rows first, which would commit the deletes without their replacements
+        if self.staging:
+            # staging tables are created first, as DDL commits implicitly
+            for year in sorted(set(r[4].year for r in records)):
+                self._staging_for(year)
+        if deletes:
+            self.delete(deletes)
+        # inserting missing
+        if self.staging:
+            records = self._insert_staged(records)
+        if deletes:
+            with self.conn.cursor() as cursor:
+                self._insert(cursor, "property_transactions", self.columns, records, "inserting(transactions)")
+        else:
+            key = lambda r: r[0]
+            self._insert_sharded("property_transactions", self.columns, records, "inserting(transactions)", key)
+
+    def resume(self) -> None:
+        # staging tables left by an interrupted run hold committed rows: picked up again when staging,
+        # otherwise swapped in now, before this run inserts into their partitions
+        self._staged()
+        if not self.staging:
+            self.flush()
+
+    def flush(self) -> None:
+        # each staged year swapped into its (empty) partition, once per run; ids provisional until now
+        # move above the table's, as the rows of other years were inserted meanwhile
         with self.conn.cursor() as cursor:
-            # inserting missing
-            sql = """
-            INSERT IGNORE INTO property_transactions
-            (property_id, tenure_id, new_build, price, ts)
-            VALUES
-            (%s, %s, %s, %s, %s)
-            """
-            inbound_records = [r for r in records if r[0] and r[1]]
-            for batch in self._batch_page(inbound_records, "inserting(transactions)"):
-                cursor.executemany(sql, batch)
+            for year, staging in sorted(self._staged().items()):
+                partition = self.partitions[year]
+                with metricslib.metrics.stage(f"exchange({partition})") as stage:
+                    cursor.execute(f"SELECT COUNT(*) FROM `{staging}`")
+                    stage.add(rows=int(cursor.fetchone()[0]))
+                    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM property_transactions")
+                    (offset,) = cursor.fetchone()
+                    cursor.execute(f"UPDATE `{staging}` SET id = id + %s ORDER BY id DESC", (int(offset),))
+                    cursor.execute(
+                        f"ALTER TABLE property_transactions EXCHANGE PARTITION `{partition}` WITH TABLE `{staging}`"
+                    )
+                    cursor.execute(f"DROP TABLE `{staging}`")
+                    cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM property_transactions")
+                    (next_id,) = cursor.fetchone()
+                    cursor.execute(f"ALTER TABLE property_transactions AUTO_INCREMENT = {int(next_id)}")
+                del self.staged[year]
+
+    def _insert_staged(
+        self, records: List[Tuple[int, int, bool, float, datetime, str]]
+    ) -> List[Tuple[int, int, bool, float, datetime, str]]:
+        # rows of a staged year go to its staging table, the rest are returned to insert as usual
+        by_staging: Dict[str, List[Any]] = {}
+        others = []
+        for record in records:
+            staging = self._staging_for(record[4].year)
+            (by_staging.setdefault(staging, []) if staging else others).append(record)
+        with self.conn.cursor() as cursor:
+            for staging, staged_records in sorted(by_staging.items()):
+                self._insert(cursor, staging, self.columns, staged_records, f"inserting(transactions:{staging})")
+        return others
+
+    def _staging_for(self, year: int) -> Optional[str]:
+        # a year is staged when its partition is empty the first time the run meets it (a year loaded anew):
+        # its rows pile up in a plain table, committed with each chunk, until `flush`
+        staged = self._staged()
+        if not self.staging or year in staged or year in self.unstaged or year not in self.partitions:
+            return staged.get(year)
+        if self._partition_empty(self.partitions[year]):
+            staging = STAGING_PREFIX + self.partitions[year]
+            with self.conn.cursor() as cursor:
+                cursor.execute(f"CREATE TABLE `{staging}` LIKE property_transactions")
+                cursor.execute(f"ALTER TABLE `{staging}` REMOVE PARTITIONING")
+            staged[year] = staging
+        else:
+            self.unstaged.add(year)
+        return staged.get(year)
+
+    def _staged(self) -> Dict[int, str]:
+        # staging tables left by an interrupted run hold committed rows, and are picked up again
+        if self.staged is None:
+            years = {partition: year for (year, partition) in self.partitions.items()}
+            for name in self.leftovers:
+                if name[len(STAGING_PREFIX) :] not in years:
+                    raise RuntimeError(
+                        f"{name} holds rows of an interrupted partition loading run, but property_transactions has "
+                        f"no partition {name[len(STAGING_PREFIX):]} to swap them into: "
+                        "restore the partition, or drop the table and run again with resume=false"
+                    )
+            self.staged = {}
+            with self.conn.cursor() as cursor:
+                for name in self.leftovers:
+                    partition = name[len(STAGING_PREFIX) :]
+                    if self._partition_empty(partition):
+                        self.staged[years[partition]] = name
+                    else:
+                        # exchanged before the run stopped, the table holds the empty partition swapped out
+                        cursor.execute(f"DROP TABLE `{name}`")
+        return self.staged
+
+    def _partition_empty(self, partition: str) -> bool:
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"SELECT 1 FROM property_transactions PARTITION (`{partition}`) LIMIT 1")
+            return not cursor.fetchall()
+
+    def postgroup_ids_for(self, guids: List[str]) -> Set[int]:
+        # postgroups of the stored transactions, read before they are deleted (a change may move them elsewhere)
+        postgroup_ids = set()
+        with self.conn.cursor() as cursor:
+            for i in range(0, len(guids), LOOKUP_SIZE):
+                page = guids[i : i + LOOKUP_SIZE]
+                cursor.execute(
+                    f"""
+                    SELECT DISTINCT pc.postgroup_id
+                    FROM property_transactions pt
+                        INNER JOIN properties p ON p.id = pt.property_id
+                        INNER JOIN postcodes pc ON pc.id = p.postcode_id
+                    WHERE pt.guid IN ({', '.join(['%s'] * len(page))})
+                    """,
+                    page,
+                )
+                postgroup_ids.update(pgid for (pgid,) in cursor)
+        return postgroup_ids
+
+    def delete(self, guids: List[str]):
+        if not guids:
+            return
+        # staged rows are not in the table yet
+        tables = ["property_transactions"] + sorted(self._staged().values())
+        with self.conn.cursor() as cursor, metricslib.metrics.stage("delete(property_transactions)") as stage:
+            stage.add(rows=len(guids))
+            for i in tqdm(range(0, len(guids), LOOKUP_SIZE), desc="deleting(transactions)", leave=False):
+                page = guids[i : i + LOOKUP_SIZE]
+                started = time.perf_counter()
+                in_page = ", ".join(["%s"] * len(page))
+                for table in tables:
+                    cursor.execute(f"DELETE FROM `{table}` WHERE guid IN ({in_page})", page)
+                metricslib.metrics.observe("delete(property_transactions)", time.perf_counter() - started)
 
 
 class SchoolRepository(BaseRepository):
@@ -266,15 +778,9 @@ class SchoolRepository(BaseRepository):
         records = set((pcids.get(pc), name) for (pc, name) in schools)
         with self.conn.cursor() as cursor:
             # inserting missing
-            sql = """
-            INSERT IGNORE INTO schools
-            (postcode_id, name)
-            VALUES
-            (%s, %s)
-            """
+            columns = ["postcode_id", "name"]
             inbound_records = [r for r in records if r[0] and r[1]]
-            for batch in self._batch_page(inbound_records, "inserting(schools)"):
-                cursor.executemany(sql, batch)
+            self._insert(cursor, "schools", columns, inbound_records, "inserting(schools)")
             # mapping
             cursor.execute(
                 """
@@ -286,41 +792,189 @@ class SchoolRepository(BaseRepository):
 
 
 class RatingRepository(BaseRepository):
-    def ensure(
+    def records_for(
         self,
         ratings: Set[Tuple[str, str, str, float, datetime]],
         sids: Dict[Tuple[str, str], int],
         epids: Dict[str, int],
-    ):
+    ) -> List[Tuple[int, int, float, datetime]]:
         records = set(
             (sids.get((pc, name), None), epids.get(ep, None), rating, ts) for (pc, name, ep, rating, ts) in ratings
         )
+        return [r for r in records if r[0] and r[1]]
+
+    def insert(self, records: List[Tuple[int, int, float, datetime]]):
+        # inserting missing
+        columns = ["school_id", "education_phase_id", "rating", "ts"]
+        self._insert_sharded("school_ratings", columns, records, "inserting(ratings)", lambda r: r[0])
+
+
+class AggregateRepository(BaseRepository):
+    def touch(self, postgroup_ids: Set[int]) -> None:
+        # postgroups whose summaries are stale, committed together with the rows that made them so
+        with self.conn.cursor() as cursor:
+            records = sorted((pgid,) for pgid in postgroup_ids if pgid)
+            self._insert(cursor, "stale_postgroups", ["postgroup_id"], records, "touching(postgroups)")
+
+    def refresh(self) -> None:
+        with self.conn.cursor() as cursor:
+            # first run over an already loaded database: every postgroup is stale
+            cursor.execute("SELECT COUNT(*) FROM postgroup_locality_prices")
+            if not cursor.fetchone()[0]:
+                cursor.execute("INSERT IGNORE INTO stale_postgroups (postgroup_id) SELECT id FROM postgroups")
+            cursor.execute("SELECT postgroup_id FROM stale_postgroups ORDER BY postgroup_id")
+            postgroup_ids = [pgid for (pgid,) in cursor.fetchall()]
+            with metricslib.metrics.stage("refresh(aggregates)") as stage:
+                stage.add(rows=len(postgroup_ids))
+                for i in tqdm(range(0, len(postgroup_ids), LOOKUP_SIZE), desc="refreshing(aggregates)", leave=False):
+                    started = time.perf_counter()
+                    page = postgroup_ids[i : i + LOOKUP_SIZE]
+                    in_page = ", ".join(["%s"] * len(page))
+                    cursor.execute(f"DELETE FROM postgroup_locality_prices WHERE postgroup_id IN ({in_page})", page)
+                    cursor.execute(
+                        f"""
+                        INSERT INTO postgroup_locality_prices (postgroup_id, locality_id, average_price, transactions)
+                        SELECT pc.postgroup_id, lpc.locality_id, AVG(pt.price), COUNT(*)
+                        FROM localities_postcodes lpc
+                            INNER JOIN postcodes pc ON pc.id = lpc.postcode_id
+                            INNER JOIN properties p ON p.postcode_id = pc.id
+                            INNER JOIN property_transactions pt ON pt.property_id = p.id
+                        WHERE pc.postgroup_id IN ({in_page})
+                        GROUP BY pc.postgroup_id, lpc.locality_id
+                        """,
+                        page,
+                    )
+                    cursor.execute(f"DELETE FROM postgroup_ratings WHERE postgroup_id IN ({in_page})", page)
+                    cursor.execute(
+                        f"""
+                        INSERT INTO postgroup_ratings (postgroup_id, average_rating, ratings)
+                        SELECT pc.postgroup_id, AVG(sr.rating), COUNT(*)
+                        FROM postcodes pc
+                            INNER JOIN schools s ON s.postcode_id = pc.id
+                            INNER JOIN school_ratings sr ON sr.school_id = s.id
+                        WHERE pc.postgroup_id IN ({in_page})
+                        GROUP BY pc.postgroup_id
+                        """,
+                        page,
+                    )
+                    cursor.execute(f"DELETE FROM stale_postgroups WHERE postgroup_id IN ({in_page})", page)
+                    metricslib.metrics.observe("refresh(aggregates)", time.perf_counter() - started)
+
+
+class ManifestRepository(BaseRepository):
+    def committed(self, source_file: iolib.SourceFile) -> int:
+        # bytes of the file already loaded and committed (its size, once completed)
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT bytes_committed FROM etl_files WHERE fingerprint = %s", (source_file.fingerprint,))
+            found = cursor.fetchall()
+            return int(found[0][0]) if found else 0
+
+    def mark(self, source_file: iolib.SourceFile, bytes_committed: int) -> None:
+        record = (
+            source_file.path,
+            source_file.size,
+            source_file.mtime,
+            bytes_committed,
+            bytes_committed >= source_file.size,
+            source_file.fingerprint,
+        )
         with self.conn.cursor() as cursor:
-            # inserting missing
-            sql = """
-            INSERT IGNORE INTO school_ratings
-            (school_id, education_phase_id, rating, ts)
-            VALUES
-            (%s, %s, %s, %s)
-            """
-            inbound_records = [r for r in records if r[0] and r[1]]
-            for batch in self._batch_page(inbound_records, "inserting(ratings)"):
-                cursor.executemany(sql, batch)
+            cursor.execute("SELECT id FROM etl_files WHERE fingerprint = %s", (source_file.fingerprint,))
+            found = cursor.fetchall()
+            if found:
+                sql = """
+                UPDATE etl_files
+                SET path = %s, size = %s, mtime = %s, bytes_committed = %s, completed = %s, fingerprint = %s,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                """
+                cursor.execute(sql, record + (found[0][0],))
+            else:
+                sql = """
+                INSERT INTO etl_files
+                (path, size, mtime, bytes_committed, completed, fingerprint)
+                VALUES
+                (%s, %s, %s, %s, %s, %s)
+                """
+                cursor.execute(sql, record)
+
+
+class GenerationRepository(BaseRepository):
+    # tables whose row counts are published with each generation
+    tables = [
+        "localities",
+        "locality_prefixes",
+        "postcode_areas",
+        "postgroups",
+        "postcode_sectors",
+        "postcodes",
+        "localities_postcodes",
+        "property_types",
+        "tenures",
+        "properties",
+        "property_transactions",
+        "education_phases",
+        "schools",
+        "school_ratings",
+        "postgroup_locality_prices",
+        "postgroup_ratings",
+    ]
+
+    def publish(self) -> int:
+        # a completed load, under the next generation: readers may cache results until the generation changes
+        with self.conn.cursor() as cursor:
+            counts = []
+            for table in self.tables:
+                cursor.execute(f"SELECT COUNT(*) FROM `{table}`")
+                counts.append((table, int(cursor.fetchone()[0])))
+            cursor.execute("INSERT INTO load_generations (completed_at) VALUES (CURRENT_TIMESTAMP)")
+            # this connection's id (LAST_INSERT_ID()), whatever another load publishes meanwhile
+            generation = cursor.lastrowid
+            columns = ["generation_id", "table_name", "row_count"]
+            records = [(generation, table, count) for (table, count) in counts]
+            self._insert(cursor, "load_generation_tables", columns, records, "publishing(generation)")
+        return generation
 
 
 def repositories(config) -> Repositories:
-    conn = mysql.connect(**config["mysql"])
+    bulk_load = config.getboolean("etl", "bulk_load", fallback=False)
+    cache_folder = config.get("etl", "cache_folder", fallback=None) or None
+    backend = storagelib.backend_for(config, bulk_load)
+    if cache_folder:
+        # snapshots of one database's ids, never read against another one sharing the folder
+        database = hashlib.sha256(backend.identity().encode("utf-8")).hexdigest()[:16]
+        cache_folder = os.path.join(cache_folder, f"{backend.name}-{database}")
+    connections = max(1, config.getint("etl", "connections", fallback=1))
+    connections = min(connections, backend.max_connections or connections)
+    pool = ConnectionPool([backend.connect() for _ in range(connections)], local_infile=bulk_load)
+    partition_loading = config.getboolean("etl", "partition_loading", fallback=False)
+    partitions = backend.partitions(pool.connections[0], "property_transactions")
+    leftovers = backend.tables(pool.connections[0], STAGING_PREFIX)
+    # the coordinator holds lookups and checkpoints, the independent dimensions are spread over the pool
+    conn, loader = pool.connections[0], pool.loaders[0]
+    # (postgroups and sectors reference the level above, so they stay with the postcodes on the coordinator)
+    dimension_conns = [pool.connections[i % len(pool)] for i in range(1, 6)]
+    dimension_loaders = [pool.loader_for(c) for c in dimension_conns]
+    transactions = TransactionRepository(conn, loader, pool, partitions, leftovers, staging=partition_loading)
+    transactions.resume()
     return Repositories(
         conn,
-        localities=LocalityRepository(conn),
-        postgroups=PostgroupRepository(conn),
-        postcodes=PostcodeRepository(conn),
-        localities_postgroups=LocalityPostcodeRepository(conn),
-        property_types=PropertyTypeRepository(conn),
-        tenures=TenureRepository(conn),
-        properties=PropertyRepository(conn),
-        transactions=TransactionRepository(conn),
-        education_phases=EducationPhaseRepository(conn),
-        schools=SchoolRepository(conn),
-        ratings=RatingRepository(conn),
+        localities=LocalityRepository(dimension_conns[0], dimension_loaders[0], cache_folder),
+        postcode_areas=PostcodeAreaRepository(dimension_conns[1], dimension_loaders[1], cache_folder),
+        postgroups=PostgroupRepository(conn, loader, cache_folder),
+        postcode_sectors=PostcodeSectorRepository(conn, loader, cache_folder),
+        postcodes=PostcodeRepository(conn, loader, cache_folder),
+        localities_postgroups=LocalityPostcodeRepository(conn, loader),
+        property_types=PropertyTypeRepository(dimension_conns[2], dimension_loaders[2], cache_folder),
+        tenures=TenureRepository(dimension_conns[3], dimension_loaders[3], cache_folder),
+        properties=PropertyRepository(conn, loader, pool),
+        transactions=transactions,
+        education_phases=EducationPhaseRepository(dimension_conns[4], dimension_loaders[4], cache_folder),
+        schools=SchoolRepository(conn, loader),
+        ratings=RatingRepository(conn, loader, pool),
+        aggregates=AggregateRepository(conn, loader),
+        manifest=ManifestRepository(conn, loader),
+        generations=GenerationRepository(conn, loader),
+        pool=pool,
+        backend=backend,
     )
@@ -0,0 +1,94 @@
+import hashlib
+from array import array
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+SEPARATOR = "\x1f"
+
+
+def key_hash(key: tuple) -> Tuple[int, int]:
+    # the 64-bit hash the map is sorted by, and an independent 32-bit check from the rest of the digest
+    digest = hashlib.blake2b(SEPARATOR.join(map(str, key)).encode("utf-8"), digest_size=12).digest()
+    return int.from_bytes(digest[:8], "little", signed=True), int.from_bytes(digest[8:], "little", signed=True)
+
+
+class CompactIdMap:
+    # 64-bit key hashes in a sorted int64 buffer next to int32 checks and int32 ids, plus a small unsorted delta;
+    # a hash found with another check belongs to another key, so a hit means all 96 bits match (a false hit
+    # is left to a 96-bit collision); hashes shared by different keys are flagged and resolved through
+    # `resolve` (the source of truth)
+    def __init__(self, resolve: Callable[[tuple], Optional[int]] = None) -> None:
+        self.resolve = resolve
+        self.hashes = np.empty(0, dtype=np.int64)
+        self.checks = np.empty(0, dtype=np.int32)
+        self.ids = np.empty(0, dtype=np.int32)
+        self.delta: Dict[int, Tuple[int, int]] = {}
+        self.collisions: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self.hashes) + len(self.delta)
+
+    def build(self, rows: Iterable[Tuple[tuple, int]]) -> "CompactIdMap":
+        hashes, checks, ids = array("q"), array("i"), array("i")
+        for key, id in rows:
+            h, check = key_hash(key)
+            hashes.append(h)
+            checks.append(check)
+            ids.append(id)
+        self._merge(
+            np.frombuffer(hashes, dtype=np.int64),
+            np.frombuffer(checks, dtype=np.int32),
+            np.frombuffer(ids, dtype=np.int32),
+        )
+        return self
+
+    def add(self, key: tuple, id: int) -> None:
+        h, check = key_hash(key)
+        found = self._find(h)
+        if found is not None and found != (check, id):
+            self.collisions.add(h)
+        else:
+            self.delta[h] = (check, id)
+        if len(self.delta) > max(100_000, len(self.hashes) // 8):
+            self.compact()
+
+    def get(self, key: tuple, default: Optional[int] = None) -> Optional[int]:
+        h, check = key_hash(key)
+        if h in self.collisions:
+            found = self.resolve(key) if self.resolve else None
+            return found if found is not None else default
+        found = self._find(h)
+        # the same hash under another check: a key that is not in the map
+        return found[1] if found is not None and found[0] == check else default
+
+    def compact(self) -> None:
+        if self.delta:
+            hashes = np.fromiter(self.delta.keys(), dtype=np.int64, count=len(self.delta))
+            checks = np.fromiter((c for (c, _) in self.delta.values()), dtype=np.int32, count=len(self.delta))
+            ids = np.fromiter((id for (_, id) in self.delta.values()), dtype=np.int32, count=len(self.delta))
+            self.delta = {}
+            self._merge(
+                np.concatenate([self.hashes, hashes]),
+                np.concatenate([self.checks, checks]),
+                np.concatenate([self.ids, ids]),
+            )
+
+    def _find(self, h: int) -> Optional[Tuple[int, int]]:
+        found = self.delta.get(h)
+        if found is None and len(self.hashes):
+            i = int(np.searchsorted(self.hashes, h))
+            if i < len(self.hashes) and self.hashes[i] == h:
+                found = (int(self.checks[i]), int(self.ids[i]))
+        return found
+
+    def _merge(self, hashes: np.ndarray, checks: np.ndarray, ids: np.ndarray) -> None:
+        order = np.argsort(hashes, kind="stable")
+        hashes, checks, ids = hashes[order], checks[order], ids[order]
+        # collision verification: equal hashes with different checks or ids belong to different keys
+        same = hashes[1:] == hashes[:-1]
+        clashes = same & ((checks[1:] != checks[:-1]) | (ids[1:] != ids[:-1]))
+        if clashes.any():
+            self.collisions.update(int(h) for h in hashes[1:][clashes])
+        keep = np.concatenate([[True], ~same]) if len(hashes) else np.empty(0, dtype=bool)
+        self.hashes, self.checks, self.ids = hashes[keep], checks[keep], ids[keep]
@@ -0,0 +1,265 @@
+import bz2
+import csv
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import queue
+import threading
+import zipfile
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Generator, List, Optional, Tuple
+
+from tqdm import tqdm
+
+BUFFER_SIZE = 4 * 1024 * 1024
+SAMPLES = 16
+SAMPLE_SIZE = 256 * 1024
+READ_AHEAD = 8
+
+# compressed sources are streamed as they are, zip members are addressed as `archive.zip!/member.csv`
+decompressors = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+ZIP_SEPARATOR = "!/"
+
+
+@dataclass(frozen=True)
+class SourceFile:
+    path: str
+    size: int
+    mtime: float
+    fingerprint: str
+
+
+class ProgressReader(io.RawIOBase):
+    def __init__(self, raw, progress: tqdm) -> None:
+        self.raw = raw
+        self.progress = progress
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        read = self.raw.readinto(buffer)
+        if read and self.progress is not None:
+            self.progress.update(read)
+        return read
+
+    def seekable(self) -> bool:
+        return self.raw.seekable()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.raw.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.raw.tell()
+
+    def close(self) -> None:
+        self.raw.close()
+        super().close()
+
+
+class ThreadedReader(io.RawIOBase):
+    # reads (and so decompresses) in a thread, a few blocks ahead of the consumer
+    def __init__(self, raw, block_size: int = BUFFER_SIZE, read_ahead: int = READ_AHEAD) -> None:
+        self.raw = raw
+        self.block_size = block_size
+        self.blocks = queue.Queue(read_ahead)
+        self.block = memoryview(b"")
+        # the thread stops after the end of the stream or an error, both are kept for every later read
+        self.eof = False
+        self.error: BaseException = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self.thread.start()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self.block:
+            if self.error is not None:
+                raise self.error
+            if self.eof:
+                return 0
+            block = self.blocks.get()
+            if isinstance(block, BaseException):
+                self.error = block
+                raise block
+            if not block:
+                self.eof = True
+                return 0
+            self.block = memoryview(block)
+        read = min(len(buffer), len(self.block))
+        buffer[:read] = self.block[:read]
+        self.block = self.block[read:]
+        return read
+
+    def close(self) -> None:
+        if not self.closed:
+            self.stopped.set()
+            while self.thread.is_alive():
+                try:
+                    self.blocks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.raw.close()
+        super().close()
+
+    def _read_ahead(self) -> None:
+        try:
+            while not self.stopped.is_set():
+                block = self.raw.read(self.block_size)
+                self.blocks.put(block)
+                if not block:
+                    return
+        except BaseException as e:
+            self.blocks.put(e)
+
+
+class RangeReader(io.RawIOBase):
+    def __init__(self, raw, start: int, end: Optional[int]) -> None:
+        self.raw = raw
+        self.raw.seek(start)
+        self.remaining = end - start if end is not None else None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.remaining is None:
+            return self.raw.readinto(buffer)
+        if self.remaining <= 0:
+            return 0
+        read = self.raw.readinto(memoryview(buffer)[: self.remaining])
+        self.remaining -= read
+        return read
+
+    def close(self) -> None:
+        self.raw.close()
+        super().close()
+
+
+def find_csv_files(folderpath: str, prefix: str = None) -> List[str]:
+    # plain and compressed csv files, and the csv members of zip archives
+    filepaths = []
+    extensions = (".csv",) + tuple(f".csv{e}" for e in decompressors)
+    for root, _, filenames in os.walk(folderpath):
+        for filename in filenames:
+            if filename.endswith(".zip"):
+                with zipfile.ZipFile(os.path.join(root, filename)) as archive:
+                    for member in archive.namelist():
+                        if member.endswith(".csv") and _prefixed(prefix, filename, os.path.basename(member)):
+                            filepaths.append(os.path.join(root, filename) + ZIP_SEPARATOR + member)
+            elif _prefixed(prefix, filename) and filename.endswith(extensions):
+                filepaths.append(os.path.join(root, filename))
+    return sorted(filepaths)
+
+
+def _prefixed(prefix: str, *filenames: str) -> bool:
+    return not prefix or any(f.startswith(prefix) for f in filenames)
+
+
+def is_compressed(filepath: str) -> bool:
+    return ZIP_SEPARATOR in filepath or filepath.endswith(tuple(decompressors))
+
+
+def size_of(filepath: str) -> int:
+    # bytes as stored, so compressed bytes for compressed sources
+    if ZIP_SEPARATOR in filepath:
+        archive, member = filepath.split(ZIP_SEPARATOR, 1)
+        with zipfile.ZipFile(archive) as zf:
+            return zf.getinfo(member).compress_size
+    return os.path.getsize(filepath)
+
+
+def describe(filepath: str) -> SourceFile:
+    # content hash: whole file when small, evenly spaced samples otherwise (cheap on multi-GB files);
+    # samples miss edits between them, so the modification time is part of a sampled fingerprint
+    if ZIP_SEPARATOR in filepath:
+        return _describe_member(filepath)
+    stat = os.stat(filepath)
+    digest = hashlib.sha256(str(stat.st_size).encode("utf-8"))
+    with open(filepath, "rb") as fh:
+        if stat.st_size <= SAMPLES * SAMPLE_SIZE * 16:
+            for block in iter(lambda: fh.read(BUFFER_SIZE), b""):
+                digest.update(block)
+        else:
+            digest.update(str(stat.st_mtime_ns).encode("utf-8"))
+            for i in range(SAMPLES):
+                fh.seek((stat.st_size - SAMPLE_SIZE) * i // (SAMPLES - 1))
+                digest.update(fh.read(SAMPLE_SIZE))
+    return SourceFile(filepath, stat.st_size, stat.st_mtime, digest.hexdigest())
+
+
+def _describe_member(filepath: str) -> SourceFile:
+    # zip members: the archive's own checksum and sizes of the member stand for its content
+    archive, member = filepath.split(ZIP_SEPARATOR, 1)
+    with zipfile.ZipFile(archive) as zf:
+        info = zf.getinfo(member)
+    digest = hashlib.sha256(f"{member}|{info.CRC}|{info.compress_size}|{info.file_size}".encode("utf-8"))
+    return SourceFile(filepath, info.compress_size, os.stat(archive).st_mtime, digest.hexdigest())
+
+
+def split_ranges(filepath: str, range_size: int, start: int = 0) -> Generator[Tuple[int, int], None, None]:
+    # byte ranges aligned to line ends (for files without a header or multi-line fields)
+    if is_compressed(filepath):
+        # no random access into a compressed stream: one range, restarted from the beginning unless completed
+        size = size_of(filepath)
+        if start < size:
+            yield 0, size
+        return
+    size = os.path.getsize(filepath)
+    with open(filepath, "rb") as fh:
+        while start < size:
+            end = min(start + range_size, size)
+            if end < size:
+                fh.seek(end)
+                fh.readline()
+                end = fh.tell()
+            yield start, end
+            start = end
+
+
+@contextmanager
+def open_text(filepath: str, encoding: str, desc: str = None, start: int = 0, end: int = None, progress=True):
+    # single pass: progress is reported from the bytes consumed (compressed bytes, for compressed sources)
+    # against the file size; `progress` may also be any object with an `update(bytes)` method
+    compressed = is_compressed(filepath)
+    if compressed:
+        start, end = 0, None
+    total = (end if end is not None else size_of(filepath)) - start
+    desc = desc or os.path.basename(filepath)
+    bar = tqdm(desc=desc, total=total, unit="B", unit_scale=True) if progress is True else nullcontext(progress or None)
+    with bar as bar:
+        if compressed:
+            raw = ThreadedReader(_decompressed(filepath, bar))
+        else:
+            raw = ProgressReader(RangeReader(open(filepath, "rb", buffering=0), start, end), bar)
+        with io.TextIOWrapper(io.BufferedReader(raw, buffer_size=BUFFER_SIZE), encoding=encoding, newline="") as fh:
+            yield fh
+
+
+def _decompressed(filepath: str, progress):
+    if ZIP_SEPARATOR in filepath:
+        archive, member = filepath.split(ZIP_SEPARATOR, 1)
+        # the member keeps the archive open until it is closed itself
+        with zipfile.ZipFile(ProgressReader(open(archive, "rb", buffering=0), progress)) as zf:
+            return zf.open(member)
+    extension = os.path.splitext(filepath)[1]
+    return decompressors[extension](ProgressReader(open(filepath, "rb", buffering=0), progress), "rb")
+
+
+def read_csv(filepath: str, encoding: str = "utf-8", header: bool = False, **kwargs):
+    csvheader = None
+    with open_text(filepath, encoding=encoding, **kwargs) as filehandle:
+        spamreader = csv.reader(filehandle)
+        if header:
+            csvheader = next(spamreader, None)
+            while not csvheader or not csvheader[0]:
+                csvheader = next(spamreader, None)
+            if csvheader:
+                csvheader = [h.upper() for h in csvheader]
+        for csvrow in spamreader:
+            yield csvheader, csvrow
@@ -0,0 +1,224 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+# upper bounds (seconds) of the batch latency histogram buckets
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+PROFILE_INTERVAL = 0.005
+
+
+@dataclass
+class Histogram:
+    counts: List[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+    sum: float = 0.0
+    count: int = 0
+
+    def observe(self, value: float) -> None:
+        i = 0
+        while i < len(BUCKETS) and value > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+@dataclass
+class StageMetrics:
+    name: str
+    calls: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    peak_rss_bytes: int = 0
+    children_peak_rss_bytes: int = 0
+    batches: Histogram = field(default_factory=Histogram)
+
+    def add(self, rows: int = 0, bytes: int = 0) -> None:
+        self.rows += rows
+        self.bytes += bytes
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "stage": self.name,
+            "calls": self.calls,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "children_peak_rss_bytes": self.children_peak_rss_bytes,
+            "batches": {
+                "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], self.batches.counts)),
+                "sum": self.batches.sum,
+                "count": self.batches.count,
+            },
+        }
+
+
+class SamplingProfiler:
+    # samples the stack of one thread at a fixed interval, counted as folded stacks (flamegraph input)
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def _sample(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.stages: Dict[str, StageMetrics] = {}
+        self.lock = threading.Lock()
+        self.started = datetime.now()
+        self.filepath: Optional[str] = None
+        self.format = "jsonl"
+        self.profile: Set[str] = set()
+        self.profile_folder = "."
+        # sampled stacks by stage name, over every time the stage ran
+        self.stacks: Dict[str, Counter] = {}
+
+    def configure(self, config) -> None:
+        self.filepath = config.get("etl", "metrics_file", fallback=None) or None
+        self.format = config.get("etl", "metrics_format", fallback="jsonl") or "jsonl"
+        if self.format not in ("jsonl", "prometheus"):
+            raise ValueError(f"Unknown metrics_format '{self.format}', expected 'jsonl' or 'prometheus'")
+        self.profile = set(s.strip() for s in config.get("etl", "profile", fallback="").split(",") if s.strip())
+        self.profile_folder = config.get("etl", "profile_folder", fallback=None) or "."
+
+    def get(self, name: str) -> StageMetrics:
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str):
+        # wall and cpu time of the block, memory high-water mark when it ends, sampled stacks when profiled
+        metrics = self.get(name)
+        profiler = None
+        if name in self.profile or "*" in self.profile:
+            profiler = SamplingProfiler(threading.get_ident())
+            profiler.start()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield metrics
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            with self.lock:
+                metrics.calls += 1
+                metrics.wall_seconds += wall
+                metrics.cpu_seconds += cpu
+                metrics.peak_rss_bytes = max(metrics.peak_rss_bytes, peak_rss_bytes())
+                metrics.children_peak_rss_bytes = max(
+                    metrics.children_peak_rss_bytes, peak_rss_bytes(resource.RUSAGE_CHILDREN)
+                )
+            if profiler:
+                profiler.stop()
+                with self.lock:
+                    self.stacks.setdefault(name, Counter()).update(profiler.stacks)
+
+    def observe(self, name: str, seconds: float) -> None:
+        # latency of one batch (statement) sent on behalf of a stage
+        metrics = self.get(name)
+        with self.lock:
+            metrics.batches.observe(seconds)
+
+    def emit(self) -> None:
+        with self.lock:
+            stages = [s.as_dict() for s in self.stages.values()]
+            stacks = {name: Counter(c) for (name, c) in self.stacks.items()}
+        for name, counts in stacks.items():
+            _save_folded(os.path.join(self.profile_folder, f"profile-{_slug(name)}.folded"), counts)
+        if not self.filepath:
+            return
+        os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        if self.format == "prometheus":
+            # textfile collector format, replaced atomically so a scrape never reads half a file
+            with open(self.filepath + ".tmp", "w", encoding="utf-8") as fh:
+                fh.write(_prometheus(stages))
+            os.replace(self.filepath + ".tmp", self.filepath)
+        else:
+            with open(self.filepath, "a", encoding="utf-8") as fh:
+                for s in stages:
+                    fh.write(json.dumps({"run": self.started.isoformat(), **s}) + "\n")
+
+
+def peak_rss_bytes(who: int = resource.RUSAGE_SELF) -> int:
+    # ru_maxrss is reported in kilobytes on linux, in bytes on macos
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _save_folded(filepath: str, stacks: Counter) -> None:
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath + ".tmp", "w", encoding="utf-8") as fh:
+        for stack, count in stacks.most_common():
+            fh.write(f"{stack} {count}\n")
+    os.replace(filepath + ".tmp", filepath)
+
+
+def _slug(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name).strip("_")
+
+
+def _prometheus(stages: List[Dict[str, object]]) -> str:
+    lines = []
+    counters = [
+        ("etl_stage_calls_total", "counter", "calls", "Times the stage ran"),
+        ("etl_stage_wall_seconds_total", "counter", "wall_seconds", "Wall-clock time spent in the stage"),
+        ("etl_stage_cpu_seconds_total", "counter", "cpu_seconds", "CPU time of this process spent in the stage"),
+        ("etl_stage_rows_total", "counter", "rows", "Rows processed by the stage"),
+        ("etl_stage_bytes_total", "counter", "bytes", "Source bytes processed by the stage"),
+        ("etl_stage_peak_rss_bytes", "gauge", "peak_rss_bytes", "Resident memory high-water mark"),
+        ("etl_stage_children_peak_rss_bytes", "gauge", "children_peak_rss_bytes", "Worker memory high-water mark"),
+    ]
+    for metric, kind, key, help in counters:
+        lines.append(f"# HELP {metric} {help}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f'{metric}{{stage="{_label(s["stage"])}"}} {s[key]}' for s in stages)
+    lines.append("# HELP etl_batch_seconds Latency of each statement batch")
+    lines.append("# TYPE etl_batch_seconds histogram")
+    for s in stages:
+        batches, label, cumulative = s["batches"], _label(s["stage"]), 0
+        if not batches["count"]:
+            continue
+        for le, count in batches["buckets"].items():
+            cumulative += count
+            lines.append(f'etl_batch_seconds_bucket{{stage="{label}",le="{le}"}} {cumulative}')
+        lines.append(f'etl_batch_seconds_sum{{stage="{label}"}} {batches["sum"]}')
+        lines.append(f'etl_batch_seconds_count{{stage="{label}"}} {batches["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
@@ -1,4 +1,7 @@
-import dateparser
+from dataclasses import dataclass, field
+from typing import Set, Tuple
+
+import datelib
 
 header = {
     "name": ["SCHOOL NAME"],
@@ -8,38 +11,78 @@ header = {
     "ts": ["PUBLICATION DATE"],
 }
 
+# cleaned columns kept by the parse cache (see columnlib)
+cached_columns = {
+    "name": "str",
+    "postcode": "str",
+    "phase_of_education": "str",
+    "overall_effectiveness": "float",
+    "ts": "datetime",
+}
+
+dates = datelib.DateParser()
+
+
+def compile_decoder(csvheader):
+    # resolves the header aliases once per file, instead of once per row
+    header_indices = {}
+    for k, v in header.items():
+        for vi in v:
+            if vi in csvheader:
+                header_indices[k] = csvheader.index(vi.upper())
+                break
+        if not k in header_indices:
+            raise KeyError(f"None of the keys for '{k}' found")
+    i_name, i_postcode, i_phase, i_effectiveness, i_ts = (header_indices[k] for k in header)
+
+    def decode(csvrow):
+        if csvrow and csvrow[0]:
+            try:
+                overall_effectiveness = csvrow[i_effectiveness].strip()
+                if overall_effectiveness != "NULL":
+                    return {
+                        "name": csvrow[i_name].strip(),
+                        "postcode": csvrow[i_postcode].strip(),
+                        "phase_of_education": csvrow[i_phase].strip(),
+                        "overall_effectiveness": float(overall_effectiveness),
+                        "ts": dates.parse(csvrow[i_ts].strip()),
+                    }
+            except (IndexError, ValueError) as e:
+                print((e, csvrow))
+        return None
+
+    return decode
+
+
+def decode(csvrows):
+    # generator of records, compiling one decoder per header
+    decoder, decoder_header = None, None
+    for csvheader, csvrow in csvrows:
+        if csvheader is not decoder_header:
+            decoder_header = csvheader
+            try:
+                decoder = compile_decoder(csvheader)
+            except KeyError as e:
+                print((e, csvheader))
+                decoder = None
+        doc = decoder(csvrow) if decoder else None
+        if doc:
+            yield doc
+
+
+def docs_from(columns):
+    return (dict(zip(cached_columns, values)) for values in zip(*(columns[k] for k in cached_columns)))
+
+
+@dataclass
+class Batch:
+    education_phases: Set[str] = field(default_factory=set)
+    schools: Set[Tuple[str, str]] = field(default_factory=set)
+    school_ratings: Set[tuple] = field(default_factory=set)
 
-def transform(csvheader, csvrow):
-    if csvrow and csvrow[0]:
-        try:
-            header_indices = {}
-            for k, v in header.items():
-                for vi in v:
-                    if vi in csvheader:
-                        header_indices[k] = csvheader.index(vi.upper())
-                        break
-                if not k in header_indices:
-                    raise KeyError(f"None of the keys for '{k}' found")
-            doc = {k: csvrow[i].strip() for (k, i) in header_indices.items()}
-            if doc["overall_effectiveness"] != "NULL":
-                doc["overall_effectiveness"] = float(doc["overall_effectiveness"])
-                doc["ts"] = dateparser.parse(doc["ts"])
-                return doc
-            else:
-                return None
-        except Exception as e:
-            print((e, csvheader))
-
-
-def get_education_phases_from(csvrecords):
-    return set(r["phase_of_education"] for r in csvrecords)
-
-
-def get_schools_from(csvrecords):
-    return set((r["postcode"], r["name"]) for r in csvrecords)
-
-
-def get_school_ratings_from(csvrecords):
-    return set(
-        (r["postcode"], r["name"], r["phase_of_education"], r["overall_effectiveness"], r["ts"]) for r in csvrecords
-    )
+    def add(self, doc):
+        self.education_phases.add(doc["phase_of_education"])
+        self.schools.add((doc["postcode"], doc["name"]))
+        self.school_ratings.add(
+            (doc["postcode"], doc["name"], doc["phase_of_education"], doc["overall_effectiveness"], doc["ts"])
+        )
@@ -0,0 +1,103 @@
+import csv
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Generator, Iterable, Optional, Tuple
+
+import columnlib
+import iolib
+import ofstedlib
+import pddlib
+
+STREAM_ROWS = 100_000
+
+
+class Position:
+    # compressed bytes read so far, fed by the reader like a progress bar
+    def __init__(self) -> None:
+        self.bytes = 0
+
+    def update(self, read: int) -> None:
+        self.bytes += read
+
+
+def parse_pdd_range(task: Tuple[str, int, int, Optional[str]]) -> pddlib.Batch:
+    filepath, start, end, cache_path = task
+    batch = pddlib.Batch(ranges=[(filepath, start, end)])
+    # cached columns, when this range was parsed before
+    if cache_path and columnlib.exists(cache_path):
+        for record in pddlib.records_from(columnlib.load(cache_path)):
+            batch.add_record(record)
+        return batch
+    columns = columnlib.ColumnWriter(pddlib.cached_columns) if cache_path else None
+    with iolib.open_text(filepath, encoding="utf-8", start=start, end=end, progress=False) as filehandle:
+        for csvrow in csv.reader(filehandle):
+            record = pddlib.record_from(csvrow)
+            batch.add_record(record)
+            if columns is not None:
+                columns.append(record._asdict())
+    if columns is not None:
+        columns.save(cache_path)
+    return batch
+
+
+def parse_pdd_stream(task: Tuple[str, int, int, Optional[str]]) -> Generator[pddlib.Batch, None, None]:
+    # compressed files are one range, parsed in this process while a thread decompresses ahead; handed over
+    # in parts of `STREAM_ROWS`, which end short of the file size so only the last part completes the file
+    filepath, start, end, _ = task
+    position, offset = Position(), start
+    batch = pddlib.Batch()
+    with iolib.open_text(filepath, encoding="utf-8", progress=position) as filehandle:
+        for csvrow in csv.reader(filehandle):
+            batch.add_record(pddlib.record_from(csvrow))
+            if batch.rows >= STREAM_ROWS:
+                batch.ranges = [(filepath, offset, min(position.bytes, end - 1))]
+                offset = batch.ranges[0][2]
+                yield batch
+                batch = pddlib.Batch()
+    batch.ranges = [(filepath, offset, end)]
+    yield batch
+
+
+def parse_pdd_tasks(tasks: Iterable[Tuple[str, int, int, Optional[str]]], workers: int = 1):
+    # plain ranges go to the workers, compressed files are streamed (not column cached: a part is not a range)
+    for compressed, group in itertools.groupby(tasks, key=lambda task: iolib.is_compressed(task[0])):
+        if compressed:
+            for task in group:
+                yield from parse_pdd_stream(task)
+        else:
+            yield from imap(parse_pdd_range, group, workers)
+
+
+def parse_ofsted_file(task: Tuple[str, Optional[str]]) -> ofstedlib.Batch:
+    filepath, cache_path = task
+    batch = ofstedlib.Batch()
+    # cached columns, when this file was parsed before
+    if cache_path and columnlib.exists(cache_path):
+        for doc in ofstedlib.docs_from(columnlib.load(cache_path)):
+            batch.add(doc)
+        return batch
+    columns = columnlib.ColumnWriter(ofstedlib.cached_columns) if cache_path else None
+    csvrows = iolib.read_csv(filepath, encoding="cp1252", header=True, progress=False)
+    for doc in ofstedlib.decode(csvrows):
+        batch.add(doc)
+        if columns is not None:
+            columns.append(doc)
+    if columns is not None:
+        columns.save(cache_path)
+    return batch
+
+
+def imap(fn: Callable, tasks: Iterable, workers: int = 1):
+    # ordered results, with at most `2 * workers` tasks in flight to keep memory bounded
+    if workers <= 1:
+        yield from map(fn, tasks)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(fn, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -1,9 +1,17 @@
 # https://www.gov.uk/guidance/about-the-price-paid-data#explanations-of-column-headers-in-the-ppd
-from typing import Tuple
-import dateparser
+import functools
+import itertools
+import operator
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+
+import datelib
 
 
 header = {
+    "guid": 0,
     "price": 1,
     "ts": 2,
     "postcode": 3,
@@ -18,6 +26,7 @@ header = {
     "district": 12,
     "county": 13,
     "ppd_category_type": 14,
+    "record_status": 15,
 }
 
 property_type_names = {
@@ -35,73 +44,161 @@ tenure_names = {
 }
 
 
-def fix_critical_positions(csvrow):
-    postcode = csvrow[header["postcode"]]
-    csvrow[header["postcode"]] = postcode if postcode else ""
+# small-int codes for property types and tenures, indexing these names
+property_types = list(property_type_names.values())
+property_type_codes = {k: i for (i, k) in enumerate(property_type_names)}
+tenures = list(tenure_names.values())
+tenure_codes = {k: i for (i, k) in enumerate(tenure_names)}
+
+# record status of the monthly update files: A = add, C = change, D = delete (the complete file only has adds)
+ADDED, CHANGED, DELETED = "A", "C", "D"
+
+
+class Record(NamedTuple):
+    # one cleaned row, with repeated strings interned and coded property type and tenure
+    price: Optional[float]
+    ts: Optional[datetime]
+    postcode: str
+    property_type: int
+    new_build: bool
+    tenure: int
+    number_or_name: str
+    building_or_block: str
+    street_name: str
+    locality: str
+    guid: Optional[str]
+    status: str
+
+
+class Property(NamedTuple):
+    postcode: str
+    property_type: int
+    number_or_name: str
+    building_or_block: str
+    street_name: str
+
+
+class Transaction(NamedTuple):
+    property: Property
+    tenure: int
+    new_build: bool
+    price: Optional[float]
+    ts: Optional[datetime]
+    guid: Optional[str]
+    status: str
+
+
+# cleaned columns kept by the parse cache (see columnlib), in record order
+cached_columns = {
+    "price": "float",
+    "ts": "datetime",
+    "postcode": "str",
+    "property_type": "code",
+    "new_build": "bool",
+    "tenure": "code",
+    "number_or_name": "str",
+    "building_or_block": "str",
+    "street_name": "str",
+    "locality": "str",
+    "guid": "str",
+    "status": "str",
+}
 
-    locality = csvrow[header["locality"]]
-    csvrow[header["locality"]] = locality if locality else csvrow[header["district"]]
+dates = datelib.DateParser()
 
-    property_type = csvrow[header["property_type"]]
-    csvrow[header["property_type"]] = property_type_names[property_type if property_type else "O"]
 
-    tenure_type = csvrow[header["tenure_type"]]
-    csvrow[header["tenure_type"]] = tenure_names[tenure_type if tenure_type else "U"]
+# positions read by record_from, fetched in one call
+_positions = ["price", "ts", "postcode", "property_type", "new_build", "tenure_type", "property_number_or_name"]
+_positions += ["building_or_block", "street_name", "locality", "district", "guid", "record_status"]
+_fields_from = operator.itemgetter(*(header[k] for k in _positions))
+# constructors without the keyword handling of NamedTuple.__new__
+_new_record = functools.partial(tuple.__new__, Record)
+_new_property = functools.partial(tuple.__new__, Property)
+_new_transaction = functools.partial(tuple.__new__, Transaction)
 
-    csvrow[header["new_build"]] = csvrow[header["new_build"]] == "Y"
 
+def record_from(csvrow) -> Record:
+    fields = _fields_from(csvrow)
+    price, ts, postcode, property_type, new_build, tenure_type, non, bob, sn, locality, district, guid, status = fields
     try:
-        csvrow[header["price"]] = float(csvrow[header["price"]])
-    except:
-        csvrow[header["price"]] = None
-
+        price = float(price)
+    except ValueError:
+        price = None
     try:
-        csvrow[header["ts"]] = dateparser.parse(csvrow[header["ts"]])
-    except:
-        csvrow[header["ts"]] = None
-
-    return csvrow
-
-
-def get_localities_from(csvrow):
-    return csvrow[header["locality"]]
-
-
-def get_postcode_from(csvrow) -> str:
-    return csvrow[header["postcode"]]
-
-def get_locality_postcodes_from(csvrow) -> Tuple[str, str]:
-    return (csvrow[header["locality"]], csvrow[header["postcode"]])
-
-def get_property_type_from(csvrow):
-    return csvrow[header["property_type"]]
-
-
-def get_tenure_from(csvrow):
-    return csvrow[header["tenure_type"]]
-
-
-def get_property_from(csvrow):
-    return (
-        csvrow[header["postcode"]],
-        csvrow[header["property_type"]],
-        csvrow[header["property_number_or_name"]],
-        csvrow[header["building_or_block"]],
-        csvrow[header["street_name"]],
+        ts = dates.parse(ts)
+    except Exception:
+        ts = None
+    return _new_record(
+        (
+            price,
+            ts,
+            sys.intern(postcode),
+            property_type_codes[property_type if property_type else "O"],
+            new_build == "Y",
+            tenure_codes[tenure_type if tenure_type else "U"],
+            sys.intern(non),
+            sys.intern(bob),
+            sys.intern(sn),
+            sys.intern(locality or district),
+            guid or None,
+            sys.intern(status) if status else ADDED,
+        )
     )
 
 
-def get_transaction_from(csvrow):
-    return (
-        (
-            csvrow[header["postcode"]],
-            csvrow[header["property_type"]],
-            csvrow[header["property_number_or_name"]],
-            csvrow[header["building_or_block"]],
-            csvrow[header["street_name"]],
-        ),
-        csvrow[header["tenure_type"]],
-        csvrow[header["new_build"]],
-        csvrow[header["price"]],
-        csvrow[header["ts"]],
-    )
+def records_from(columns) -> Iterator[Record]:
+    # records rebuilt from cached columns
+    return itertools.starmap(Record, zip(*(columns[k] for k in cached_columns)))
+
+
+def ids_by_code(names: List[str], ids: Dict[str, int]) -> Dict[int, int]:
+    # ids by name (from the repositories) turned into ids by code
+    return {code: ids[name] for (code, name) in enumerate(names) if name in ids}
+
+
+@dataclass
+class Batch:
+    rows: int = 0
+    ranges: List[Tuple[str, int, int]] = field(default_factory=list)
+    postcodes: Set[str] = field(default_factory=set)
+    localities: Set[str] = field(default_factory=set)
+    locality_postcodes: Set[Tuple[str, str]] = field(default_factory=set)
+    property_types: Set[str] = field(default_factory=set)
+    tenures: Set[str] = field(default_factory=set)
+    properties: Set[Property] = field(default_factory=set)
+    # keyed by GUID, so a later change of the same transaction replaces the earlier one
+    transactions: Dict[Union[str, Transaction], Transaction] = field(default_factory=dict)
+
+    def add_record(self, record: Record):
+        price, ts, postcode, property_type, new_build, tenure, non, bob, sn, locality, guid, status = record
+        p = _new_property((postcode, property_type, non, bob, sn))
+        # pile up
+        self.rows += 1
+        self.postcodes.add(postcode)
+        self.localities.add(locality)
+        self.locality_postcodes.add((locality, postcode))
+        self.property_types.add(property_types[property_type])
+        self.tenures.add(tenures[tenure])
+        self.properties.add(p)
+        t = _new_transaction((p, tenure, new_build, price, ts, guid, status))
+        self.transactions[guid or t] = t
+
+    @property
+    def bytes(self) -> int:
+        return sum(end - start for (_, start, end) in self.ranges)
+
+    def committed(self) -> Dict[str, int]:
+        # furthest byte reached per file (ranges arrive in order)
+        return {filepath: end for (filepath, _, end) in self.ranges}
+
+    def merge(self, other: "Batch") -> "Batch":
+        self.rows += other.rows
+        self.ranges.extend(other.ranges)
+        self.postcodes |= other.postcodes
+        self.localities |= other.localities
+        self.locality_postcodes |= other.locality_postcodes
+        self.property_types |= other.property_types
+        self.tenures |= other.tenures
+        self.properties |= other.properties
+        self.transactions.update(other.transactions)
+        return self
@@ -0,0 +1,78 @@
+import queue
+import threading
+from typing import Callable, Iterable, List
+
+POLL_INTERVAL = 0.1
+
+# end of stream marker, passed down from stage to stage
+DONE = object()
+
+
+def run(source: Iterable, stages: List[Callable], queue_size: int = 2):
+    # the source and each stage in their own thread, joined by bounded queues (a full queue holds the
+    # upstream stage back, so at most `queue_size` items wait between two stages); results are yielded in order
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(queue_size) for _ in range(len(stages) + 1)]
+
+    def put(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return DONE
+
+    def produce() -> None:
+        try:
+            for item in source:
+                if not put(queues[0], item):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        put(queues[0], DONE)
+
+    def work(fn: Callable, inbox: queue.Queue, outbox: queue.Queue) -> None:
+        try:
+            for item in iter(lambda: get(inbox), DONE):
+                if not put(outbox, fn(item)):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        put(outbox, DONE)
+
+    threads = [threading.Thread(target=produce, name="pipeline-source", daemon=True)]
+    for i, fn in enumerate(stages):
+        args = (fn, queues[i], queues[i + 1])
+        threads.append(threading.Thread(target=work, args=args, name=f"pipeline-stage-{i}", daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        for item in iter(lambda: get(queues[-1]), DONE):
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        # also reached when the consumer fails or stops early: upstream threads give up on their next put/get
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def sequential(source: Iterable, stages: List[Callable]):
+    # same results as `run`, one item at a time in the calling thread
+    for item in source:
+        for fn in stages:
+            item = fn(item)
+        yield item
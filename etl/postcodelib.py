@@ -0,0 +1,39 @@
+import re
+from typing import Dict, Iterable, NamedTuple, Optional
+
+INWARD_LENGTH = 3
+
+area_pattern = re.compile(r"^[A-Z]+")
+
+
+class PostcodeLevels(NamedTuple):
+    # "SW1A 1AA": area "SW", district "SW1A" (the outward code, stored as a postgroup), sector "SW1A 1"
+    area: str
+    district: str
+    sector: str
+    unit: str
+
+
+def normalise(postcode: str) -> str:
+    # upper case, single spaced, and the space put back before the inward code when it is missing
+    postcode = " ".join(postcode.upper().split())
+    if " " not in postcode and len(postcode) > INWARD_LENGTH + 1:
+        postcode = f"{postcode[:-INWARD_LENGTH]} {postcode[-INWARD_LENGTH:]}"
+    return postcode
+
+
+def parse(postcode: str) -> Optional[PostcodeLevels]:
+    unit = normalise(postcode or "")
+    if not unit:
+        return None
+    district, _, inward = unit.partition(" ")
+    area = area_pattern.match(district)
+    # without an inward code (partial postcodes) the district stands for its own sector
+    sector = f"{district} {inward[0]}" if inward[:1].isdigit() else district
+    return PostcodeLevels(area.group(0) if area else district, district, sector, unit)
+
+
+def levels_for(postcodes: Iterable[str]) -> Dict[str, PostcodeLevels]:
+    # keyed by the postcode as given, which is how the postcodes are stored and looked up
+    levels = {pc: parse(pc) for pc in postcodes}
+    return {pc: l for (pc, l) in levels.items() if l}
@@ -0,0 +1,20 @@
+import re
+import unicodedata
+from typing import List
+
+# longest prefix stored in `locality_prefixes`, longer searches range-read `localities.search_key`
+PREFIX_LENGTH = 12
+
+separators = re.compile(r"[-/_]")
+non_key = re.compile(r"[^A-Z0-9 ]")
+
+
+def search_key(name: str) -> str:
+    # "St. Mary's-on-Sea" -> "ST MARYS ON SEA" (the web tier normalises its input the same way)
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    name = separators.sub(" ", name.upper())
+    return " ".join(non_key.sub("", name).split())
+
+
+def prefixes_for(key: str) -> List[str]:
+    return [key[:i] for i in range(1, min(len(key), PREFIX_LENGTH) + 1) if not key[:i].endswith(" ")]
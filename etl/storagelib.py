@@ -0,0 +1,215 @@
+import os
+import re
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List
+
+import mysql.connector as mysql
+
+SQLITE_SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ddl", "schema.sqlite.sql"
+)
+# server limits reported to dblib.BulkLoader: a small max_allowed_packet keeps
+# multi-row statements under SQLite's limit of 32766 bound variables
+SQLITE_MAX_ALLOWED_PACKET = 256 * 1024
+# the statements after this line of the schema wait for `build_indexes`
+SQLITE_DEFERRED = re.compile(r"^-- deferred$", re.MULTILINE)
+SQLITE_PRAGMAS = [
+    # bulk load: readers are not blocked by the writer, and a commit does not wait on fsync of the database file
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 1073741824",
+]
+
+sqlite3.register_adapter(datetime, lambda ts: ts.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+class Backend(ABC):
+    # where the repositories write: connections speaking the MySQL dialect, and the steps around the load
+    name: str = None
+    # connections that may write at once (None: no limit)
+    max_connections: int = None
+
+    @abstractmethod
+    def connect(self):
+        pass
+
+    @abstractmethod
+    def identity(self) -> str:
+        # which database the backend writes to, for anything kept outside it (id cache snapshots)
+        pass
+
+    def partitions(self, conn, table: str) -> Dict[int, str]:
+        # partitions of a table by year, for the tables partitioned that way
+        return {}
+
+    def tables(self, conn, prefix: str) -> List[str]:
+        # tables named with a prefix, for the work tables a run creates (and an interrupted one leaves)
+        return []
+
+    def build_indexes(self, conn) -> None:
+        # indexes are maintained as rows arrive, unless the backend defers them
+        pass
+
+    def finish(self, conn) -> None:
+        pass
+
+
+class MySQLBackend(Backend):
+    name = "mysql"
+
+    def __init__(self, config, bulk_load: bool = False) -> None:
+        self.config = config
+        self.bulk_load = bulk_load
+
+    def connect(self) -> mysql.MySQLConnection:
+        return mysql.connect(**self.config["mysql"], allow_local_infile=self.bulk_load)
+
+    def identity(self) -> str:
+        options = self.config["mysql"]
+        server = options.get("unix_socket") or f"{options.get('host', 'localhost')}:{options.get('port', '3306')}"
+        return f"mysql://{server}/{options.get('database', '')}"
+
+    def partitions(self, conn, table: str) -> Dict[int, str]:
+        # named p<year> in the schema, the catch-all partition is left out
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+                """,
+                (table,),
+            )
+            names = [name for (name,) in cursor.fetchall()]
+        return {int(name[1:]): name for name in names if re.fullmatch(r"p\d{4}", name)}
+
+    def tables(self, conn, prefix: str) -> List[str]:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT TABLE_NAME FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE %s
+                """,
+                (prefix.replace("_", "\\_") + "%",),
+            )
+            return sorted(name for (name,) in cursor.fetchall())
+
+
+class SQLiteBackend(Backend):
+    name = "sqlite"
+    # a single writer: further connections would only wait on the database lock
+    max_connections = 1
+
+    def __init__(self, config, bulk_load: bool = False) -> None:
+        self.filepath = config.get("sqlite", "database", fallback="region_home_school.sqlite")
+        self.schema_filepath = config.get("sqlite", "schema", fallback=SQLITE_SCHEMA_FILE)
+
+    def connect(self) -> "Connection":
+        conn = Connection(self.filepath)
+        for pragma in SQLITE_PRAGMAS:
+            conn.db.execute(pragma)
+        # an empty database gets the tables and the indexes the load reads, the others wait for `build_indexes`
+        if not conn.db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]:
+            conn.db.executescript(";\n".join(self._statements(deferred=False)))
+            conn.commit()
+        return conn
+
+    def identity(self) -> str:
+        return f"sqlite://{os.path.abspath(self.filepath)}"
+
+    def build_indexes(self, conn: "Connection") -> None:
+        # built once over the loaded rows, rather than maintained row by row during the load
+        for statement in self._statements(deferred=True):
+            conn.db.execute(statement.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+        conn.commit()
+
+    def finish(self, conn: "Connection") -> None:
+        # read-optimised snapshot: planner statistics, and the write-ahead log folded back into the file
+        conn.commit()
+        conn.db.execute("ANALYZE")
+        conn.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _statements(self, deferred: bool) -> List[str]:
+        with open(self.schema_filepath, "r", encoding="utf-8") as fh:
+            upfront, *later = SQLITE_DEFERRED.split(fh.read(), maxsplit=1)
+        ddl = re.sub(r"--[^\n]*", "", "".join(later) if deferred else upfront)
+        return [s.strip() for s in ddl.split(";") if s.strip()]
+
+
+class Cursor:
+    # the MySQL dialect used by dblib, translated for SQLite
+    def __init__(self, cursor: sqlite3.Cursor) -> None:
+        self.cursor = cursor
+
+    def __enter__(self) -> "Cursor":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.cursor.close()
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self) -> int:
+        return self.cursor.lastrowid
+
+    def execute(self, sql: str, params=()) -> None:
+        if "@@max_allowed_packet" in sql:
+            self.cursor.execute("SELECT ?, 0", (SQLITE_MAX_ALLOWED_PACKET,))
+        else:
+            self.cursor.execute(translate(sql), tuple(params))
+
+    def executemany(self, sql: str, records) -> None:
+        self.cursor.executemany(translate(sql), records)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size: int = 1):
+        return self.cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+
+class Connection:
+    # same surface as a mysql.connector connection, as far as dblib uses it
+    def __init__(self, filepath: str) -> None:
+        self.db = sqlite3.connect(filepath, check_same_thread=False)
+
+    def cursor(self, *_, **__) -> Cursor:
+        return Cursor(self.db.cursor())
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def rollback(self) -> None:
+        self.db.rollback()
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def translate(sql: str) -> str:
+    return sql.replace("%s", "?").replace("INSERT IGNORE", "INSERT OR IGNORE")
+
+
+backends = {
+    "mysql": MySQLBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def backend_for(config, bulk_load: bool = False) -> Backend:
+    name = config.get("etl", "backend", fallback="mysql") or "mysql"
+    if name not in backends:
+        raise ValueError(f"Unknown backend '{name}', expected one of {', '.join(backends)}")
+    return backends[name](config, bulk_load)
@@ -0,0 +1,70 @@
+import bz2
+import gzip
+import io
+import lzma
+import threading
+import zipfile
+
+import pytest
+
+import iolib
+
+ROWS = [["a", "b"], ["1", "2"]]
+# no trailing newline: the last read of the stream is the one that meets its end
+CONTENT = b"a,b\n1,2"
+
+
+def _within(fn, timeout: float = 10.0):
+    # run in a thread, so that a reader stuck at the end of the stream fails the test instead of hanging it
+    results, errors = [], []
+
+    def run():
+        try:
+            results.append(fn())
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the read did not return"
+    if errors:
+        raise errors[0]
+    return results[0]
+
+
+def _read_all(filepath: str):
+    return _within(lambda: [row for (_, row) in iolib.read_csv(filepath, progress=False)])
+
+
+@pytest.mark.parametrize("suffix, opener", [(".gz", gzip.open), (".bz2", bz2.open), (".xz", lzma.open)])
+def test_read_csv_compressed_without_trailing_newline(tmp_path, suffix, opener):
+    filepath = str(tmp_path / f"pp-2020.csv{suffix}")
+    with opener(filepath, "wb") as fh:
+        fh.write(CONTENT)
+    assert _read_all(filepath) == ROWS
+
+
+def test_read_csv_zip_member_without_trailing_newline(tmp_path):
+    archive = str(tmp_path / "pp-2020.zip")
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("pp-2020.csv", CONTENT)
+    (member,) = iolib.find_csv_files(str(tmp_path), prefix="pp-")
+    assert _read_all(member) == ROWS
+
+
+def test_threaded_reader_end_and_errors_persist():
+    reader = iolib.ThreadedReader(io.BytesIO(CONTENT))
+    buffer = bytearray(64)
+    assert _within(lambda: [reader.readinto(buffer) for _ in range(3)]) == [len(CONTENT), 0, 0]
+    reader.close()
+
+    class Failing(io.RawIOBase):
+        def read(self, size=-1):
+            raise OSError("corrupt stream")
+
+    reader = iolib.ThreadedReader(Failing())
+    for _ in range(2):
+        with pytest.raises(OSError, match="corrupt stream"):
+            _within(lambda: reader.readinto(buffer))
+    reader.close()
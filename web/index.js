@@ -21,6 +21,8 @@ const basePath = !process.cwd().endsWith("web") ? './web' : './'
 const app = express();
 const webPort = config.web.port;
 const db = mysql.createConnection(config.mysql);
+const cacheSize = parseInt(config.web.cache_size || 1000)
+const generationCheckMs = parseFloat(config.web.generation_check_seconds || 5) * 1000
 
 // serve static files
 app.use(express.static(`${basePath}/public`))
@@ -44,10 +46,53 @@ const resultMap = r => ({
     avgOfstedInadequate: r.average_rating && r.average_rating < 1.5,
 })
 
+// place-name search key, normalised as etl/searchlib.py does: "St. Mary's-on-Sea" -> "ST MARYS ON SEA"
+const prefixLength = 12 // longest prefix in locality_prefixes
+const searchKey = name => name
+    .normalize('NFKD').replace(/[^\x00-\x7F]/g, '')
+    .toUpperCase().replace(/[-/_]/g, ' ').replace(/[^A-Z0-9 ]/g, '')
+    .split(/\s+/).filter(w => w).join(' ')
+
+// result cache: the data only changes when the etl publishes a new load generation
+const cache = new Map()
+let generation = null
+let generationCheckedAt = 0
+
+const currentGeneration = (callback) => {
+    if (Date.now() - generationCheckedAt < generationCheckMs)
+        return callback(generation)
+    db.query("SELECT MAX(id) generation FROM load_generations", (err, results) => {
+        const latest = err ? null : results[0].generation
+        if (latest !== generation)
+            cache.clear()
+        generation = latest
+        generationCheckedAt = Date.now()
+        callback(generation)
+    })
+}
+
+const cachedQuery = (sql, params, callback) => {
+    currentGeneration(gen => {
+        // keyed by (query parameters, generation), never cached before the first generation is published
+        const key = JSON.stringify([gen, sql, params])
+        if (gen !== null && cache.has(key))
+            return callback(null, cache.get(key))
+        db.query(sql, params, (err, results) => {
+            if (!err && gen !== null && gen === generation) {
+                cache.set(key, results)
+                if (cache.size > cacheSize)
+                    cache.delete(cache.keys().next().value) // oldest first
+            }
+            callback(err, results)
+        })
+    })
+}
+
 // routes
 app.get('/', (req, res) => {
-    db.query(
+    cachedQuery(
         "SELECT id, name FROM postgroups ORDER BY name",
+        [],
         (_, results) => {
             const postgroups = results.map(r => ({
                 value: r.id,
@@ -81,21 +126,14 @@ app.get('/', (req, res) => {
                     SELECT
                         pg.name "postgroup",
                         l.name "locality",
-                        AVG(pt.price) "average_price",
-                        (SELECT AVG(sr.rating)
-                            FROM postcodes pc2
-                            INNER JOIN schools s ON s.postcode_id = pc2.id
-                            INNER JOIN school_ratings sr ON sr.school_id = s.id
-                            WHERE pc2.postgroup_id = pg.id) "average_rating"
-                    FROM localities l
-                        INNER JOIN localities_postcodes lpc ON lpc.locality_id = l.id
-                        INNER JOIN postcodes pc1 ON pc1.id = lpc.postcode_id
-                        INNER JOIN postgroups pg ON pg.id = pc1.postgroup_id
-                        INNER JOIN properties p ON p.postcode_id = pc1.id
-                        INNER JOIN property_transactions pt ON pt.property_id = p.id
+                        plp.average_price "average_price",
+                        pr.average_rating "average_rating"
+                    FROM postgroup_locality_prices plp
+                        INNER JOIN postgroups pg ON pg.id = plp.postgroup_id
+                        INNER JOIN localities l ON l.id = plp.locality_id
+                        LEFT JOIN postgroup_ratings pr ON pr.postgroup_id = plp.postgroup_id
                     WHERE (pg.id = -1 OR pg.id in (?))
-                    GROUP BY pg.name, l.name
-                    HAVING AVG(pt.price) BETWEEN ? AND ?
+                        AND plp.average_price BETWEEN ? AND ?
                     ORDER BY pg.name, l.name`.trim()
                 const params = [
                     req.query.postgroupIds
@@ -103,33 +141,31 @@ app.get('/', (req, res) => {
                         : null,
                     parseInt(req.query.priceRangeStart), 
                     parseInt(req.query.priceRangeEnd)]
-                db.query(sql, params, (_, results) => {
+                cachedQuery(sql, params, (_, results) => {
                     data['results'] = results.map(resultMap)
                     return res.render("index", data)
                 })
             }
-            else if (req.query.mode == "place-name" && req.query.placeName) {
+            else if (req.query.mode == "place-name" && req.query.placeName && searchKey(req.query.placeName)) {
+                // short searches are a point read on the prefix table, longer ones a range read on the search key
+                const key = searchKey(req.query.placeName)
+                const match = key.length <= prefixLength
+                    ? "INNER JOIN locality_prefixes lp ON lp.locality_id = l.id WHERE lp.prefix = ?"
+                    : "WHERE l.search_key LIKE ?"
                 const sql = `
                     SELECT
                         pg.name "postgroup",
                         l.name "locality",
-                        AVG(pt.price) "average_price",
-                        (SELECT AVG(sr.rating)
-                            FROM postcodes pc2
-                            INNER JOIN schools s ON s.postcode_id = pc2.id
-                            INNER JOIN school_ratings sr ON sr.school_id = s.id
-                            WHERE pc2.postgroup_id = pg.id) "average_rating"
+                        plp.average_price "average_price",
+                        pr.average_rating "average_rating"
                     FROM localities l
-                        INNER JOIN localities_postcodes lpc ON lpc.locality_id = l.id
-                        INNER JOIN postcodes pc1 ON pc1.id = lpc.postcode_id
-                        INNER JOIN postgroups pg ON pg.id = pc1.postgroup_id
-                        INNER JOIN properties p ON p.postcode_id = pc1.id
-                        INNER JOIN property_transactions pt ON pt.property_id = p.id
-                    WHERE l.name LIKE ?
-                    GROUP BY pg.name, l.name
+                        INNER JOIN postgroup_locality_prices plp ON plp.locality_id = l.id
+                        INNER JOIN postgroups pg ON pg.id = plp.postgroup_id
+                        LEFT JOIN postgroup_ratings pr ON pr.postgroup_id = plp.postgroup_id
+                    ${match}
                     ORDER BY pg.name, l.name`.trim()
-                const params = [`${req.query.placeName}%`]
-                db.query(sql, params, (_, results) => {
+                const params = [key.length <= prefixLength ? key : `${key}%`]
+                cachedQuery(sql, params, (_, results) => {
                     data['results'] = results.map(resultMap)
                     return res.render("index", data)
                 })